@@ -0,0 +1,73 @@
+import csv
+import json
+import math
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "web_shiny"))
+
+import trajectory
+from batch_targets import main, read_targets, solve_chunk
+
+
+def test_read_targets_rejects_bad_rows(tmp_path):
+    path = tmp_path / "targets.csv"
+    path.write_text("target_x,target_y,net_clearance,topspin,sidespin\n2.3,0.2,0.05,20,0\n2.3,left,0.05,0,0\n")
+    with pytest.raises(ValueError, match=":3:"):
+        read_targets(path)
+
+
+def test_solve_chunk_checks_the_returned_launch():
+    # full topspin at 2.6m needs more than v_max, that launch stays unconverged
+    targets = [(2.3, 0.2, 0.05, 20, 0), (2.6, 0.0, 0.0, 100, 0)]
+    results = solve_chunk(targets)
+    assert [converged for _, converged, _, _ in results] == [True, False]
+    for target, (params, _, miss, clears_net) in zip(targets, results):
+        x_landing, y_landing, z_net = trajectory.simulate_landing(*params)
+        assert miss == pytest.approx(math.hypot(x_landing - target[0], y_landing - target[1]))
+        assert clears_net == (z_net >= trajectory.NET_HEIGHT)
+    assert results[1][2] > 0.01
+
+
+def test_targets_to_settings_and_presets(tmp_path):
+    targets = tmp_path / "drill.csv"
+    targets.write_text("name,target_x,target_y,net_clearance,topspin,sidespin\n"
+                       "deep,2.3,0.2,0.05,20,0\n"
+                       ",2.5,-0.3,0.05,0,10\n")
+    presets = tmp_path / "presets.json"
+    presets.write_text(json.dumps({"serve": dict(speed=50, spin_angle=0, spin_strength=0, pan=0, tilt=0)}))
+
+    assert main([str(targets), "--presets", str(presets), "--workers", "1"]) == 0
+
+    with open(tmp_path / "drill_settings.csv", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["name"] for row in rows] == ["deep", "target 2"]
+    for row in rows:
+        assert row["converged"] == "True" and row["clears_net"] == "True"
+        params = [float(row[field]) for field in ("vx0", "vy0", "vz0", "omega_x", "omega_y", "omega_z")]
+        x_landing, y_landing, _ = trajectory.simulate_landing(*params)
+        assert (x_landing, y_landing) == pytest.approx((float(row["target_x"]), float(row["target_y"])), abs=5e-3)
+
+    saved = json.loads(presets.read_text())
+    assert set(saved) == {"serve", "deep", "target 2"}
+    assert saved["deep"] == {field: float(rows[0][field]) for field in ("speed", "spin_angle", "spin_strength",
+                                                                         "pan", "tilt")}
+
+
+def test_failed_targets_are_not_saved_as_presets(tmp_path):
+    targets = tmp_path / "drill.csv"
+    # the launcher pans at most 15 degrees, the corner is 23 degrees off its axis
+    targets.write_text("name,target_x,target_y,net_clearance,topspin,sidespin\n"
+                       "deep,2.3,0.2,0.05,20,0\n"
+                       "corner,1.6,0.7,0.05,0,0\n")
+    presets = tmp_path / "presets.json"
+
+    assert main([str(targets), "--presets", str(presets), "--workers", "1"]) == 1
+    assert set(json.loads(presets.read_text())) == {"deep"}
+    with open(tmp_path / "drill_settings.csv", newline="") as f:
+        assert [row["within_limits"] for row in csv.DictReader(f)] == ["True", "False"]
+
+    assert main([str(targets), "--presets", str(presets), "--workers", "1", "--include-failed"]) == 1
+    assert set(json.loads(presets.read_text())) == {"deep", "corner"}
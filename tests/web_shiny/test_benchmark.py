@@ -0,0 +1,33 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "web_shiny"))
+
+import benchmark
+
+
+def results(wall_time, rhs_evals):
+    return dict(cases=dict(calculate=dict(calls=1, wall_time=wall_time, rhs_evals=rhs_evals)))
+
+
+def test_compare_flags_regressions():
+    baseline = results(1.0, 1000)
+    assert benchmark.compare(results(1.2, 1050), baseline) == []
+    assert len(benchmark.compare(results(1.5, 1000), baseline)) == 1
+    assert len(benchmark.compare(results(1.0, 1200), baseline)) == 1
+
+
+def test_microbenchmarks_get_a_looser_time_tolerance():
+    baseline = results(30e-6, 0)
+    assert benchmark.compare(results(50e-6, 0), baseline) == []
+    assert len(benchmark.compare(results(70e-6, 0), baseline)) == 1
+
+
+def test_baseline_keeps_median_wall_times():
+    runs = [results(wall_time, 1000) for wall_time in (1.0, 3.0, 2.0)]
+    assert benchmark.median_results(runs) == results(2.0, 1000)
+
+
+def test_app_starts_without_solver_stack():
+    _, loaded = benchmark.import_app()
+    assert loaded == []
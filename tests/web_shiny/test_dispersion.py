@@ -0,0 +1,43 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "web_shiny"))
+
+import trajectory
+from dispersion import dispersion, LaunchNoise
+
+PARAMS = trajectory.quick_launch(2.2, 0.2, 0.1, 30, 0)
+
+
+def test_without_noise_all_samples_land_on_the_solution():
+    noise = LaunchNoise(speed=0, elevation=0, azimuth=0, spin=0, spin_absolute=0)
+    result = dispersion(PARAMS, noise, samples=10)
+
+    x_landing, y_landing, z_net = trajectory.simulate_landing(*PARAMS)
+    assert result.mean == pytest.approx((x_landing, y_landing), abs=1e-3)
+    assert result.covariance == pytest.approx(np.zeros((2, 2)), abs=1e-9)
+    assert result.clears_net == result.on_table == 1
+
+
+def test_ellipse_holds_the_scatter():
+    result = dispersion(PARAMS, samples=4000, seed=0)
+
+    inside = np.einsum("ij,jk,ik->i", result.landings - result.mean, np.linalg.inv(result.covariance),
+                       result.landings - result.mean) <= -2 * np.log(1 - 0.95)
+    assert inside.mean() == pytest.approx(0.95, abs=0.02)
+
+    width, height, angle = result.ellipse()
+    assert width >= height > 0
+    outline = result.ellipse_points()
+    assert np.linalg.norm(outline - result.mean, axis=1).max() == pytest.approx(width / 2, rel=1e-2)
+
+
+def test_noisier_launches_clear_the_net_less_often():
+    tight = dispersion(PARAMS, LaunchNoise(speed=0.01), seed=1)
+    loose = dispersion(PARAMS, LaunchNoise(speed=0.1, elevation=3), seed=1)
+
+    assert 0 <= loose.clears_net < tight.clears_net <= 1
+    assert dispersion(PARAMS, seed=2).landings == pytest.approx(dispersion(PARAMS, seed=2).landings, nan_ok=True)
@@ -0,0 +1,91 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "web_shiny"))
+
+import trajectory
+from landing_table import LandingTable, landing_tables, launch_velocity, load_landing_table
+
+
+@pytest.fixture(scope="module")
+def table():
+    return LandingTable.build(
+        speeds=np.linspace(4, 15, 12),
+        elevations=np.linspace(-10, 30, 17),
+        azimuths=np.linspace(-15, 15, 7),
+        topspins=np.array([-50, 0, 50]),
+        sidespins=np.array([0]),
+    )
+
+
+@pytest.mark.parametrize("target", [(2.3, 0.3, 0.05, 25, 0), (2.0, -0.2, 0.1, -40, 0)])
+def test_query_lands_on_target(table, target):
+    params = table.query(*target)
+    x_landing, y_landing, z_net = trajectory.simulate_batch(np.array(params[:3]), np.array(params[3:]))
+
+    assert x_landing[0] == pytest.approx(target[0], abs=0.01)
+    assert y_landing[0] == pytest.approx(target[1], abs=0.01)
+    assert z_net[0] - trajectory.NET_HEIGHT == pytest.approx(target[2], abs=0.01)
+    assert params[4] == pytest.approx(trajectory.omega_max * target[3] / 100)
+
+
+def test_save_and_load(table, tmp_path):
+    path = tmp_path / "table.npz"
+    table.save(path)
+
+    loaded = LandingTable.load(path)
+    np.testing.assert_array_equal(loaded.landing, table.landing)
+    assert loaded.query(2.3, 0.3, 0.05, 25, 0) == pytest.approx(table.query(2.3, 0.3, 0.05, 25, 0))
+
+
+def test_atlas_is_mapped_read_only(table, tmp_path):
+    path = tmp_path / "table.atlas"
+    table.save(path)
+
+    loaded = LandingTable.load(path)
+    assert isinstance(loaded.landing.base, np.memmap)
+    assert not loaded.landing.flags.writeable
+    np.testing.assert_array_equal(loaded.landing, table.landing)
+    np.testing.assert_array_equal(loaded.paths, table.paths)
+    assert loaded.query(2.3, 0.3, 0.05, 25, 0) == pytest.approx(table.query(2.3, 0.3, 0.05, 25, 0))
+
+
+def test_paths_follow_the_trajectory(table):
+    index = (1, 0, 6, 8, 3)  # no spin, 10 m/s, 10 degrees up, straight
+    v0 = launch_velocity(table.speeds[index[2]], table.elevations[index[3]], table.azimuths[index[4]])
+    t, x, y, z = trajectory.simulate_trajectory(*v0, 0, 0, 0)
+
+    path = table.paths[index].astype(float)
+    flying = np.isfinite(path[:, 0])
+    assert flying.any() and not flying.all()
+    expected = np.column_stack([np.interp(table.path_times, t, values) for values in (x, y, z)])
+    np.testing.assert_allclose(path[flying], expected[flying], atol=5e-3)
+
+
+def test_published_table_is_mapped_again(table, tmp_path):
+    path = str(tmp_path / "table.atlas")
+    tables = landing_tables(path, interval=0)
+    assert tables.current() is None
+
+    table.save(path)
+    first = tables.current()
+    assert first is not None and tables.current() is first
+
+    table.save(path)  # a rebuild published while the first one is in use
+    second = tables.current()
+    assert second is not first
+    np.testing.assert_array_equal(first.landing, second.landing)
+
+
+def test_load_rejects_other_physics(table, tmp_path, monkeypatch):
+    path = tmp_path / "table.npz"
+    table.save(path)
+    monkeypatch.setattr(trajectory, "C_d", 0.5)
+    monkeypatch.setattr("landing_table.physics_constants", trajectory.physics_constants)
+
+    with pytest.raises(ValueError):
+        LandingTable.load(path)
+    assert load_landing_table(path) is None
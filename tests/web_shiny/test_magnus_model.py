@@ -0,0 +1,116 @@
+import math
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "web_shiny"))
+
+import trajectory
+from magnus_model import (COS30, NOMINAL_MIN_SPEED, PRESET_STEPS, RAW_SPIN, SETTINGS, Calibration,
+                          launch_to_settings, load_calibration, motor_speeds, preset_report, settings_to_launch,
+                          within_limits)
+
+
+def test_settings_round_trip_through_launch():
+    rng = np.random.default_rng(0)
+    settings = dict(speed=rng.uniform(20, 100, 200), spin_angle=rng.uniform(-180, 180, 200),
+                    spin_strength=rng.uniform(0, 60, 200), pan=rng.uniform(-15, 15, 200),
+                    tilt=rng.uniform(-25, 35, 200))
+    params = settings_to_launch(**settings)
+    assert params.shape == (200, 6)
+
+    back = launch_to_settings(params)
+    for name in SETTINGS:
+        np.testing.assert_allclose(back[name], settings[name], atol=1e-9)
+    np.testing.assert_allclose(settings_to_launch(**back), params, atol=1e-9)
+
+
+def test_single_launch_matches_set_settings():
+    params = (10.0, 1.0, 2.0, 0.0, -0.4 * trajectory.omega_max, 0.3 * trajectory.omega_max)
+    settings = launch_to_settings(params)
+    assert all(isinstance(settings[name], float) for name in SETTINGS)
+
+    # Magnus.set_settings splits spin_strength and spin_angle back into the spin fractions
+    topspin = math.cos(math.radians(settings["spin_angle"])) * settings["spin_strength"] / 100
+    sidespin = math.sin(math.radians(settings["spin_angle"])) * settings["spin_strength"] / 100
+    assert (topspin, sidespin) == pytest.approx((-0.4, 0.3))
+    assert settings["pan"] == pytest.approx(math.degrees(math.atan2(1, 10)))
+    assert settings["tilt"] == pytest.approx(math.degrees(math.atan2(2, math.hypot(10, 1))))
+    assert math.hypot(10, 1, 2) == pytest.approx(
+        NOMINAL_MIN_SPEED + (trajectory.v_max - NOMINAL_MIN_SPEED) * settings["speed"] / 100)
+
+    # the right motor faster than the left spins the ball about z, which curves it to +y
+    top, left, right = motor_speeds(settings["speed"], topspin, sidespin)
+    assert right > left
+    assert settings_to_launch(**settings)[5] > 0
+
+
+def test_motor_speeds_mix_like_launcher_configure():
+    top, left, right = motor_speeds(40, 0.5, 0.3)
+    base = 4 * 40 / 100 + 5
+    assert (top + left + right) / 3 == pytest.approx(base)
+    assert top - (left + right) / 2 == pytest.approx(0.5 * RAW_SPIN)
+    assert (right - left) * COS30 == pytest.approx(0.3 * RAW_SPIN)
+    assert motor_speeds(0, 0, 0) == (0, 0, 0)
+
+    # full spin at a low speed slows a motor below the raw minimum, where it stalls
+    assert within_limits(dict(speed=80, spin_angle=0, spin_strength=100, pan=0, tilt=10))
+    assert not within_limits(dict(speed=10, spin_angle=0, spin_strength=100, pan=0, tilt=10))
+    assert not within_limits(dict(speed=50, spin_angle=0, spin_strength=0, pan=20, tilt=10))
+
+
+def test_calibration_fit_recovers_gains():
+    nominal = load_calibration("no_such_calibration.json")
+    assert nominal.speed_gain * 9 + nominal.speed_offset == pytest.approx(trajectory.v_max)
+    assert nominal.speed_gain * 5 + nominal.speed_offset == pytest.approx(NOMINAL_MIN_SPEED)
+    assert nominal.spin_gain * RAW_SPIN == pytest.approx(trajectory.omega_max)
+
+    measured = Calibration(1.5, 0.8, 90.0)
+    samples = []
+    for speed, spin_strength in [(20, 0), (50, 0), (90, 0), (60, 40), (60, 80), (100, 100)]:
+        top, left, right = motor_speeds(speed, spin_strength / 100, 0)
+        samples.append((speed, spin_strength, 1.5 * (top + left + right) / 3 + 0.8, 90.0 * (top - (left + right) / 2)))
+    fitted = Calibration.fit(samples)
+    assert (fitted.speed_gain, fitted.speed_offset, fitted.spin_gain) == pytest.approx(
+        (measured.speed_gain, measured.speed_offset, measured.spin_gain))
+
+    settings = dict(speed=70.0, spin_angle=30.0, spin_strength=50.0, pan=5.0, tilt=10.0)
+    back = launch_to_settings(settings_to_launch(**settings, calibration=fitted), calibration=fitted)
+    assert back == pytest.approx(settings)
+
+
+@pytest.mark.parametrize("target", [(2.0, 0.0, 0.05, 0, 0), (2.5, -0.3, 0.05, 0, 10), (2.2, 0.3, 0.1, 30, -20),
+                                    (1.8, -0.4, 0.05, -20, 0)])
+def test_solved_launch_settings_land_on_the_target(target):
+    # the launch the Target panel solves for, turned into a preset and flown like the robot launches it
+    params = trajectory.solve(*target, profile="fast", optimizer="least_squares")
+    settings = launch_to_settings(params)
+    assert within_limits(settings)
+
+    x_landing, y_landing, _ = trajectory.simulate_landing(*settings_to_launch(**settings))
+    assert (x_landing, y_landing) == pytest.approx(target[:2], abs=0.01)
+
+
+def test_launch_beyond_the_motors_is_out_of_limits():
+    # half topspin at 2.6m needs a launch faster than speed 100%
+    params = trajectory.solve(2.6, 0.2, 0.05, 50, 0, profile="fast", optimizer="least_squares")
+    settings = launch_to_settings(params)
+    assert settings["speed"] > 100
+    assert not within_limits(settings)
+
+
+def test_preset_report_flies_the_rounded_settings():
+    params = trajectory.solve(2.2, 0.3, 0.1, 30, -20, profile="fast", optimizer="least_squares")
+    report = preset_report(params)
+    assert report["spread"] is None and report["within_limits"]
+    assert all(report["preset"][name] % step == 0 for name, step in PRESET_STEPS.items())
+
+    x_landing, y_landing, _ = trajectory.simulate_landing(*settings_to_launch(**report["preset"]))
+    assert report["landing"] == pytest.approx([x_landing, y_landing])
+    assert report["landing"] == pytest.approx([2.2, 0.3], abs=0.1)  # off by the rounding of the sliders
+
+    spread = preset_report(params, spread=True)["spread"]
+    assert len(spread["ellipse"]) == 64
+    assert 0 < spread["on_table"] <= spread["clears_net"] <= 1
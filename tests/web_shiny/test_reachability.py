@@ -0,0 +1,60 @@
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "web_shiny"))
+
+import trajectory
+import reachability
+from reachability import ReachabilityMap, reachability_map, EXTRA_CLEARANCES
+
+
+@pytest.fixture(scope="module")
+def topspin_map():
+    return ReachabilityMap.build(0.05, 100, 0, cell=0.1)
+
+
+def test_reachable_cells_are_hit_within_v_max(topspin_map):
+    x, y, speed = 2.25, 0.15, topspin_map.speed_at(2.25, 0.15)
+    assert topspin_map.reachable(x, y)
+    assert 0 < speed <= trajectory.v_max
+
+    i, j = topspin_map._cell(x, y)
+    centre = ((topspin_map.x_edges[i] + topspin_map.x_edges[i + 1]) / 2,
+              (topspin_map.y_edges[j] + topspin_map.y_edges[j + 1]) / 2)
+    params, _, converged = trajectory.calculate_many([(*centre, 0.05 + extra, 100, 0) for extra in EXTRA_CLEARANCES])
+    speeds = np.linalg.norm(params[:, :3], axis=1)
+    assert speeds[converged].min() == pytest.approx(speed, abs=0.05)
+
+
+def test_off_table_and_own_half_are_out_of_reach(topspin_map):
+    assert not topspin_map.reachable(1.0, 0)
+    assert not topspin_map.reachable(2.3, 1.0)
+    assert np.isnan(topspin_map.speed_at(3.0, 0))
+
+
+def test_unreachable_cells():
+    # a full backspin ball floats, it cannot drop short behind a high net clearance
+    backspin_map = ReachabilityMap.build(0.3, -100, 0, cell=0.1)
+    assert not backspin_map.reachable(1.45, 0)
+    assert np.isfinite(backspin_map.speed).any()
+
+
+def test_maps_are_cached_per_parameter_set():
+    assert reachability_map(0.05, 0, 0) is reachability_map(0.0501, 0, 0)
+    assert reachability_map(0.05, 0, 0) is not reachability_map(0.05, 10, 0)
+
+
+def test_cancelled_build_stops_and_is_not_kept():
+    cancel = threading.Event()
+    timer = threading.Timer(0.1, cancel.set)
+    timer.start()
+    start = time.perf_counter()
+    with pytest.raises(trajectory.SolveCancelled):
+        reachability_map(0.15, 40, -30, cancel=cancel)
+    assert time.perf_counter() - start < 1  # a whole map takes seconds
+    assert not [key for key in reachability._maps if key[1:] == (40, -30)]
@@ -0,0 +1,156 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "web_shiny"))
+
+import trajectory
+from solver_cache import SolverCache, WarmStarts
+
+PARAMS = (12.0, 0.5, 1.0, 10.0, 200.0, 0.0)
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "cache.sqlite")
+
+
+def test_hit_and_miss(cache_path):
+    cache = SolverCache(cache_path)
+    assert cache.get(2.3, 0.2, 0.05, 50, 0) is None
+
+    cache.put(2.3, 0.2, 0.05, 50, 0, PARAMS)
+    assert cache.get(2.3, 0.2, 0.05, 50, 0) == PARAMS
+    # quantized, a click a few mm away is the same target
+    assert cache.get(2.302, 0.198, 0.05, 50, 0) == PARAMS
+    assert cache.get(2.3, 0.2, 0.05, 55, 0) is None
+
+    assert cache.stats() == dict(hits=2, disk_hits=0, misses=2, memory_entries=1, disk_entries=1)
+
+
+def test_memory_lru_eviction(cache_path):
+    cache = SolverCache(cache_path, memory_size=2, disk_size=2)
+    cache.put(2.0, 0, 0.05, 0, 0, PARAMS)
+    cache.put(2.1, 0, 0.05, 0, 0, PARAMS)
+    cache.get(2.0, 0, 0.05, 0, 0)
+    cache.put(2.2, 0, 0.05, 0, 0, PARAMS)
+
+    assert cache.stats()["memory_entries"] == 2
+    assert cache.get(2.0, 0, 0.05, 0, 0) == PARAMS
+    # least recently used, evicted from both tiers
+    assert cache.get(2.1, 0, 0.05, 0, 0) is None
+
+
+def test_disk_tier_survives_restart(cache_path):
+    SolverCache(cache_path).put(2.3, 0.2, 0.05, 50, 0, PARAMS)
+
+    cache = SolverCache(cache_path)
+    assert cache.get(2.3, 0.2, 0.05, 50, 0) == PARAMS
+    assert cache.disk_hits == 1
+
+
+def test_invalidated_when_physics_change(cache_path, monkeypatch):
+    cache = SolverCache(cache_path)
+    cache.put(2.3, 0.2, 0.05, 50, 0, PARAMS)
+
+    monkeypatch.setattr(trajectory, "ROBOT_HEAD_Z", 0.4)
+    assert cache.get(2.3, 0.2, 0.05, 50, 0) is None
+    assert SolverCache(cache_path).get(2.3, 0.2, 0.05, 50, 0) is None
+
+
+def test_unreadable_file_caches_in_memory(cache_path):
+    with open(cache_path, "w") as f:
+        f.write("not a cache " * 100)
+
+    cache = SolverCache(cache_path)
+    cache.put(2.3, 0.2, 0.05, 50, 0, PARAMS)
+    assert cache.get(2.3, 0.2, 0.05, 50, 0) == PARAMS
+    with open(cache_path) as f:
+        assert f.read().startswith("not a cache")
+
+
+def test_invalidate(cache_path):
+    cache = SolverCache(cache_path)
+    cache.put(2.3, 0.2, 0.05, 50, 0, PARAMS)
+    cache.invalidate()
+
+    assert cache.get(2.3, 0.2, 0.05, 50, 0) is None
+    assert SolverCache(cache_path).stats()["disk_entries"] == 0
+
+
+def test_solve_uses_cache(cache_path, monkeypatch):
+    cache = SolverCache(cache_path)
+    cache.put(2.3, 0.2, 0.05, 50, 0, PARAMS, solver=trajectory.solver_name("SLSQP", "accurate"))
+    monkeypatch.setattr(trajectory, "minimize", None)  # would fail if the optimizer ran
+
+    assert trajectory.solve(2.3, 0.2, 0.05, 50, 0, cache=cache) == PARAMS
+    # solutions of another optimizer or integrator profile are not reused
+    assert cache.get(2.3, 0.2, 0.05, 50, 0, solver=trajectory.solver_name("least_squares", "fast")) is None
+
+
+def test_failed_solves_are_not_cached(cache_path, monkeypatch):
+    cache = SolverCache(cache_path)
+    into_net = (6.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+    monkeypatch.setattr(trajectory, "_optimize", lambda *args: (into_net, True, "converged", 1))
+    trajectory.solve(2.3, 0.2, 0.05, 0, 0, cache=cache, optimizer="least_squares")
+
+    monkeypatch.setattr(trajectory, "_optimize", lambda *args: (PARAMS, False, "iteration limit", 1))
+    trajectory.solve(2.3, 0.2, 0.05, 0, 0, cache=cache, optimizer="least_squares")
+    assert cache.stats()["disk_entries"] == 0
+
+
+def test_caches_sharing_a_file_keep_each_others_solutions(cache_path):
+    # like the app, the solver service and batch workers putting solutions at the same time
+    caches = [SolverCache(cache_path) for _ in range(4)]
+    threads = [threading.Thread(target=lambda cache=cache, i=i: [cache.put(2 + i / 10, j / 100, 0.05, 0, 0, PARAMS)
+                                                                   for j in range(20)])
+               for i, cache in enumerate(caches)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert SolverCache(cache_path).stats()["disk_entries"] == 80
+    assert caches[0].get(2.3, 0.19, 0.05, 0, 0) == PARAMS  # put by another cache
+
+
+def test_warm_starts_nearest():
+    warm_starts = WarmStarts(size=2, max_distance=0.1)
+    assert warm_starts.nearest(2.3, 0.2, 0.05, 50, 0) is None
+
+    warm_starts.add(2.3, 0.2, 0.05, 50, 0, PARAMS)
+    warm_starts.add(1.8, -0.4, 0.05, 0, 0, (1, 2, 3, 4, 5, 6))
+    assert warm_starts.nearest(2.35, 0.22, 0.05, 50, 0) == PARAMS
+    assert warm_starts.nearest(2.35, 0.22, 0.05, -50, 0) is None  # spin too different
+
+    warm_starts.add(2.0, 0, 0.05, 0, 0, (6, 5, 4, 3, 2, 1))  # replaces the oldest
+    assert warm_starts.nearest(2.3, 0.2, 0.05, 50, 0) is None
+
+
+def test_solve_starts_from_warm_start(monkeypatch):
+    warm_starts = WarmStarts()
+    params = trajectory.solve(2.3, 0.2, 0.05, 50, 0, warm_starts=warm_starts)
+    assert warm_starts.nearest(2.3, 0.2, 0.05, 50, 0) == pytest.approx(params)
+
+    guesses = []
+    minimize = trajectory.minimize
+    def recording_minimize(fun, x0, **kwargs):
+        guesses.append(tuple(x0))
+        return minimize(fun, x0, **kwargs)
+    monkeypatch.setattr(trajectory, "minimize", recording_minimize)
+
+    trajectory.solve(2.32, 0.21, 0.05, 50, 0, warm_starts=warm_starts)
+    assert guesses == [pytest.approx(params)]  # no pre-solve without spin
+
+
+def test_warm_start_without_refine_skips_optimizer(monkeypatch):
+    warm_starts = WarmStarts()
+    warm_starts.add(2.3, 0.2, 0.05, 50, 0, PARAMS)
+    monkeypatch.setattr(trajectory, "_optimize", None)  # would fail if the optimizer ran
+    monkeypatch.setattr(trajectory, "minimize", None)
+
+    stats = trajectory.SolveStats()
+    assert trajectory.solve(2.32, 0.21, 0.05, 50, 0, refine=False, warm_starts=warm_starts, stats=stats) == PARAMS
+    assert stats.simulations == 1 and "not refined" in stats.message
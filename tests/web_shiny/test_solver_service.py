@@ -0,0 +1,133 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "web_shiny"))
+
+import solver_service
+import trajectory
+from magnus_model import preset_report
+from solver_cache import SolverCache
+from solver_service import QueueFull, SolverClient, SolverService, SolverServiceError, make_server
+
+
+@pytest.fixture
+def served(tmp_path):
+    """Client of a service on a free port, solving on threads instead of processes"""
+    service = SolverService(workers=2, cache=SolverCache(str(tmp_path / "cache.sqlite")),
+                            executor=ThreadPoolExecutor(max_workers=2))
+    server = make_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield SolverClient(f"http://127.0.0.1:{server.server_port}"), service
+    server.shutdown()
+    server.server_close()
+    service.close()
+
+
+@pytest.fixture
+def blocked(monkeypatch):
+    """solve_target that waits for the returned event, counting its calls"""
+    release = threading.Event()
+    calls = []
+
+    def solve_target(*target):
+        calls.append(target)
+        release.wait(5)
+        return dict(stats=dict(params=(10.0, 0, 1, 0, 0, 0)))
+
+    monkeypatch.setattr(solver_service, "solve_target", solve_target)
+    return release, calls
+
+
+def test_solve_matches_local_solve(served):
+    client, service = served
+    (t, x, y, z), stats, report = client.solve(2.3, 0.2, 0.05, 20, 0)
+
+    assert stats.success
+    assert (x[-1], y[-1], z[-1]) == pytest.approx((2.3, 0.2, 0), abs=5e-3)
+    assert np.array_equal((t, x, y, z), trajectory.simulate_trajectory(*stats.params))
+    assert report == preset_report(stats.params)
+
+    # the second request is answered from the cache
+    _, cached, cached_report = client.solve(2.3, 0.2, 0.05, 20, 0, spread=True)
+    assert cached.params == pytest.approx(stats.params)
+    assert [stage["stage"] for stage in cached.stages] == ["cached"]
+    assert cached_report == preset_report(cached.params, spread=True)
+
+    assert client.health()["status"] == "ok"
+    metrics = client.metrics()
+    assert metrics["requests"] == 2 and metrics["completed"] == 1 and metrics["cache_hits"] == 1
+
+
+def test_bad_request_is_rejected(served):
+    client, _ = served
+    with pytest.raises(SolverServiceError, match="400"):
+        client._request("post", "/solve", dict(target_x=2.3))
+
+
+def test_identical_requests_are_coalesced(blocked):
+    release, calls = blocked
+    service = SolverService(executor=ThreadPoolExecutor(max_workers=2))
+    with ThreadPoolExecutor(max_workers=3) as clients:
+        results = [clients.submit(service.solve, 2.3, 0.2, 0.05, 20, 0) for _ in range(3)]
+        while service.metrics()["coalesced"] < 2:
+            pass
+        release.set()
+        assert all(result.result()["stats"]["params"] == (10.0, 0, 1, 0, 0, 0) for result in results)
+
+    assert len(calls) == 1
+    assert service.metrics()["completed"] == 1
+    service.close()
+
+
+def test_full_queue_rejects_requests(blocked):
+    release, _ = blocked
+    service = SolverService(queue_size=1, executor=ThreadPoolExecutor(max_workers=1))
+    with ThreadPoolExecutor(max_workers=1) as clients:
+        first = clients.submit(service.solve, 2.3, 0.2, 0.05, 20, 0)
+        while not service.metrics()["in_flight"]:
+            pass
+        with pytest.raises(QueueFull):
+            service.solve(2.5, 0.2, 0.05, 20, 0)
+        release.set()
+        first.result()
+
+    assert service.metrics()["rejected"] == 1
+    service.solve(2.5, 0.2, 0.05, 20, 0)  # room again
+    service.close()
+
+
+def test_failed_solves_are_not_cached(served, monkeypatch):
+    client, service = served
+    monkeypatch.setattr(solver_service, "solve_target", lambda *target: dict(
+        trajectory=None, stats=dict(params=(6.0, 0, 0, 0, 0, 0), success=True), clears_net=False))
+    service.solve(2.3, 0.2, 0.05, 20, 0)
+    monkeypatch.setattr(solver_service, "solve_target", lambda *target: dict(
+        trajectory=None, stats=dict(params=(10.0, 0, 1, 0, 0, 0), success=False), clears_net=True))
+    service.solve(2.3, 0.2, 0.05, 20, 0)
+
+    assert service.cache.stats()["disk_entries"] == 0
+
+
+def test_client_mode_does_not_load_the_solver(served):
+    client, _ = served
+    # solves, builds a map and shows the launch settings and the landing spread like the Target panel does
+    code = ("import json, sys\n"
+            "import target_panel\n"
+            "_, _, report = target_panel.solve_in_pool(2.3, 0.2, 0.05, 20, 0, True, True, None)[0].result()\n"
+            "target_panel.build_reach(0.05, 20, 0)\n"
+            "print(target_panel.preset_text((2.3, 0.2), report), report['spread']['on_table'])\n"
+            "print(json.dumps([m for m in ('scipy', 'trajectory', 'magnus_model', 'dispersion') "
+            "if m in sys.modules]))")
+    environment = dict(os.environ, SOLVER_SERVICE_URL=client.url)
+    output = subprocess.run([sys.executable, "-c", code], env=environment, capture_output=True, text=True,
+                            check=True, cwd=os.path.join(os.path.dirname(__file__), "..", "..", "web_shiny")).stdout
+    assert output.splitlines()[-2].startswith("Launch settings: speed")
+    assert json.loads(output.splitlines()[-1]) == []
@@ -0,0 +1,321 @@
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "web_shiny"))
+
+import trajectory
+from trajectory import simulate_trajectory, simulate_landing, simulate_batch, find_landing
+
+
+@pytest.fixture
+def launches():
+    rng = np.random.default_rng(0)
+    n = 20
+    v0 = np.column_stack([rng.uniform(6, 14, n), rng.uniform(-2, 2, n), rng.uniform(0, 3, n)])
+    omega = rng.uniform(-trajectory.omega_max, trajectory.omega_max, (n, 3))
+    return v0, omega
+
+
+def test_fast_kernels_match_equations(launches):
+    v0, omega = launches
+    state = np.column_stack([np.zeros((len(v0), 2)), np.full(len(v0), 0.3), v0])
+
+    batch = trajectory.equations_batch(state, omega)
+    for i in range(len(v0)):
+        expected = trajectory.equations(0, state[i], omega[i])
+        assert trajectory.equations_fast(0, state[i], tuple(omega[i])) == pytest.approx(expected, rel=1e-12)
+        assert batch[i] == pytest.approx(expected, rel=1e-12)
+
+
+def test_simulate_trajectory_kernels_agree(launches):
+    v0, omega = launches
+    for i in range(5):
+        reference = simulate_trajectory(*v0[i], *omega[i], kernel="reference")
+        fast = simulate_trajectory(*v0[i], *omega[i], kernel="fast")
+        for expected, values in zip(reference, fast):
+            np.testing.assert_allclose(values, expected, atol=1e-9)
+
+
+def test_simulate_batch_matches_simulate_trajectory(launches):
+    v0, omega = launches
+    x_landing, y_landing, z_net = simulate_batch(v0, omega)
+
+    for i in range(len(v0)):
+        t_vals, x_vals, y_vals, z_vals = simulate_trajectory(*v0[i], *omega[i])
+        expected = find_landing(t_vals, x_vals, y_vals, z_vals)
+        # find_landing interpolates linearly between 10ms samples, allow for that
+        assert x_landing[i] == pytest.approx(expected[0], abs=0.01)
+        assert y_landing[i] == pytest.approx(expected[1], abs=0.01)
+
+
+def test_simulate_batch_net_height(launches):
+    v0, omega = launches
+    x_landing, _, z_net = simulate_batch(v0, omega)
+
+    for i in range(len(v0)):
+        _, x_vals, _, z_vals = simulate_trajectory(*v0[i], *omega[i])
+        if x_landing[i] < trajectory.NET_X:
+            assert np.isnan(z_net[i])
+        else:
+            crossing = np.argmax(x_vals >= trajectory.NET_X)
+            section = slice(crossing - 1, crossing + 1)
+            expected = np.interp(trajectory.NET_X, x_vals[section], z_vals[section])
+            assert z_net[i] == pytest.approx(expected, abs=0.01)
+
+
+def test_simulate_batch_single_launch():
+    x_landing, y_landing, z_net = simulate_batch([10, 0, 1], [0, 0, 0])
+    assert x_landing.shape == (1,)
+    assert y_landing[0] == pytest.approx(0)
+    assert z_net[0] > 0
+
+
+def test_simulate_batch_step_control_does_not_divide_by_zero():
+    # one launch rejects a step while the error of the other is exactly 0
+    v0 = [[15, 1.4785385732347962, -0.19428585192832803], [15.05, 1.4785385732347962, -0.19428585192832803]]
+    with np.errstate(divide="raise"):
+        x_landing, _, _ = simulate_batch(v0, [[0, 261.8, 0]] * 2, rtol=0.01)
+    assert np.isfinite(x_landing).all()
+
+
+def test_simulate_batch_matches_event_landing(launches):
+    v0, omega = launches
+    x_landing, y_landing, z_net = simulate_batch(v0, omega)
+
+    for i in range(len(v0)):
+        expected = simulate_landing(*v0[i], *omega[i])
+        np.testing.assert_allclose((x_landing[i], y_landing[i], z_net[i]), expected, atol=1e-9)
+
+
+def test_simulate_trajectory_stops_at_landing():
+    t_vals, x_vals, y_vals, z_vals = simulate_trajectory(10, 0.5, 1, 0, 100, 0)
+    x_landing, y_landing, z_net = simulate_landing(10, 0.5, 1, 0, 100, 0)
+
+    assert t_vals[-1] < 1
+    assert z_vals[-1] == 0
+    assert (z_vals[:-1] > 0).all()
+    assert (x_vals[-1], y_vals[-1]) == (x_landing, y_landing)
+    assert find_landing(t_vals, x_vals, y_vals, z_vals) == pytest.approx((x_landing, y_landing))
+
+
+def test_simulate_landing_before_net():
+    x_landing, _, z_net = simulate_landing(2, 0, 0, 0, 0, 0)
+    assert x_landing < trajectory.NET_X
+    assert np.isnan(z_net)
+
+
+def test_error_function_gradient_matches_finite_differences():
+    params = np.array([11.0, 1.0, 1.0, 50.0, 200.0, -30.0])
+    args = (2.3, 0.2, 0.05, 150.0, 20.0)
+
+    # both integrations run at the solver's default tolerance, so they only agree to that level
+    value, grad = trajectory.error_function_and_grad(params, *args)
+    assert value == pytest.approx(trajectory.error_function(params, *args), rel=1e-3)
+
+    eps = 1e-5
+    for k in range(len(params)):
+        step = np.zeros(len(params))
+        step[k] = eps
+        expected = (trajectory.error_function(params + step, *args)
+                    - trajectory.error_function(params - step, *args)) / (2 * eps)
+        assert grad[k] == pytest.approx(expected, rel=1e-2, abs=1e-4)
+
+
+def test_simplified_error_function_gradient_matches_finite_differences():
+    params = np.array([12.0, -0.5, 0.5])
+    args = (2.2, -0.3, 0.1)
+
+    value, grad = trajectory.simplified_error_function_and_grad(params, *args)
+    assert value == pytest.approx(trajectory.simplified_error_function(params, *args), rel=1e-3)
+
+    eps = 1e-5
+    for k in range(len(params)):
+        step = np.zeros(len(params))
+        step[k] = eps
+        expected = (trajectory.simplified_error_function(params + step, *args)
+                    - trajectory.simplified_error_function(params - step, *args)) / (2 * eps)
+        assert grad[k] == pytest.approx(expected, rel=1e-2, abs=1e-4)
+
+
+def test_integrator_profiles_match_accurate(launches):
+    v0, omega = launches
+    for i in range(5):
+        expected = np.array(simulate_landing(*v0[i], *omega[i]))
+        balanced = simulate_landing(*v0[i], *omega[i], profile="balanced")
+        fast = simulate_landing(*v0[i], *omega[i], profile="fast")
+        assert balanced == pytest.approx(expected, abs=1e-6, nan_ok=True)
+        assert fast == pytest.approx(expected, abs=5e-3, nan_ok=True)
+
+        t_vals, x_vals, y_vals, z_vals = simulate_trajectory(*v0[i], *omega[i], profile="fast")
+        assert z_vals[-1] == 0 and (z_vals[:-1] > 0).all()
+        assert (x_vals[-1], y_vals[-1]) == pytest.approx(tuple(expected[:2]), abs=5e-3)
+
+    errors = trajectory.profile_errors([tuple(v0[i]) + tuple(omega[i]) for i in range(5)])
+    assert errors["accurate"]["max_error"] == 0
+    assert errors["fast"]["max_error"] < 5e-3
+
+
+def test_fast_profile_gradient_matches_finite_differences():
+    params = np.array([11.0, 1.0, 1.0, 50.0, 200.0, -30.0])
+    args = (2.3, 0.2, 0.05, 150.0, 20.0, None, "fast")
+
+    # fixed steps make the fast objective smooth, so it agrees with its gradient more closely
+    value, grad = trajectory.error_function_and_grad(params, *args)
+    assert value == pytest.approx(trajectory.error_function(params, *args), rel=1e-6)
+
+    eps = 1e-5
+    for k in range(len(params)):
+        step = np.zeros(len(params))
+        step[k] = eps
+        expected = (trajectory.error_function(params + step, *args)
+                    - trajectory.error_function(params - step, *args)) / (2 * eps)
+        assert grad[k] == pytest.approx(expected, rel=1e-3, abs=1e-5)
+
+
+def test_batch_finite_difference_gradient_matches_sensitivities():
+    params = np.array([11.0, 1.0, 1.0, 50.0, 200.0, -30.0])
+    args = (2.3, 0.2, 0.05, 150.0, 20.0)
+
+    value, grad = trajectory.error_function_and_batch_grad(params, *args)
+    expected_value, expected_grad = trajectory.error_function_and_grad(params, *args)
+
+    assert value == pytest.approx(expected_value, rel=1e-6)
+    assert grad == pytest.approx(expected_grad, rel=1e-2, abs=1e-5)
+
+
+def test_fast_profile_solve_is_verified():
+    stats = trajectory.SolveStats()
+    params = trajectory.solve(2.3, 0.3, 0.05, 50, 20, stats=stats, profile="fast")
+
+    assert [stage["stage"] for stage in stats.stages] == ["preview", "no spin", "optimized", "verified"]
+    assert stats.stages[-1]["success"]
+    expected = trajectory.solve(2.3, 0.3, 0.05, 50, 20)
+    assert simulate_landing(*params)[:2] == pytest.approx(simulate_landing(*expected)[:2], abs=3e-3)
+
+
+def test_landing_residuals_match_error_function():
+    params = np.array([11.0, 1.0, 1.0, 50.0, 200.0, -30.0])
+    args = (2.3, 0.2, 0.05, 150.0, 20.0)
+
+    residuals, jacobian = trajectory.landing_residuals(params, *args)
+    assert trajectory.simulate_landing(*params)[2] > trajectory.NET_HEIGHT
+    assert np.sum(residuals ** 2) == pytest.approx(trajectory.error_function(params, *args), rel=1e-6)
+
+    eps = 1e-5
+    for k in range(len(params)):
+        step = np.zeros(len(params))
+        step[k] = eps
+        expected = (trajectory.landing_residuals(params + step, *args)[0]
+                    - trajectory.landing_residuals(params - step, *args)[0]) / (2 * eps)
+        np.testing.assert_allclose(jacobian[:, k], expected, rtol=1e-2, atol=1e-4)
+
+
+def test_landing_residuals_continue_below_the_net():
+    args = (2.3, 0.2, 0.05, 0.0, 0.0)
+    # lower and lower launches: into the net, then landing before it
+    net_residuals = [trajectory.landing_residuals((8.0, 0.0, vz0, 0.0, 0.0, 0.0), *args)[0][2]
+                     for vz0 in np.linspace(1.0, -1.0, 9)]
+    assert np.all(np.isfinite(net_residuals))
+    assert np.all(np.diff(net_residuals) < 0)
+
+
+def test_least_squares_clears_the_net():
+    stats = trajectory.SolveStats()
+    params = trajectory.solve(1.9, 0.4, 0.05, 0, 0, stats=stats, optimizer="least_squares")
+
+    assert [stage["stage"] for stage in stats.stages] == ["preview", "optimized"]
+    assert stats.success
+    x_landing, y_landing, z_net = simulate_landing(*params)
+    assert np.hypot(x_landing - 1.9, y_landing - 0.4) < 0.005
+    assert z_net - trajectory.NET_HEIGHT == pytest.approx(0.05, abs=0.01)
+
+
+@pytest.mark.parametrize("optimizer", ["least_squares", "SLSQP"])
+def test_solved_spin_stays_near_the_request(optimizer):
+    params = trajectory.solve(2.5, -0.4, 0.05, -50, 30, profile="fast", optimizer=optimizer)
+
+    omega_x, omega_y, omega_z = params[3:]
+    requested = trajectory.omega_max * np.array([0, -0.5, 0.3])  # no spin about the flight axis
+    np.testing.assert_allclose((omega_x, omega_y, omega_z), requested, atol=0.05 * trajectory.omega_max)
+    x_landing, y_landing, _ = simulate_landing(*params)
+    assert np.hypot(x_landing - 2.5, y_landing + 0.4) < 0.01
+
+
+def test_quick_launch_lands_near_target():
+    params = trajectory.quick_launch(2.2, 0.3, 0.05, 30, 20)
+    x_landing, y_landing, z_net = simulate_landing(*params)
+
+    assert (x_landing, y_landing) == pytest.approx((2.2, 0.3), abs=0.02)
+    assert z_net - trajectory.NET_HEIGHT == pytest.approx(0.05, abs=0.02)
+    assert params[3:] == pytest.approx((0, trajectory.omega_max * 0.3, trajectory.omega_max * 0.2))
+
+
+def test_solve_staged_refinements():
+    stages = list(trajectory.solve_staged(2.3, 0.3, 0.05, 50, 20))
+
+    assert [stage for stage, _ in stages] == ["preview", "no spin", "optimized"]
+    assert stages[-1][1] == trajectory.solve(2.3, 0.3, 0.05, 50, 20)
+
+
+def test_solve_stats():
+    stats = trajectory.SolveStats()
+    trajectory.calculate(2.3, 0.3, 0.05, 50, 20, stats=stats)
+
+    assert [stage["stage"] for stage in stats.stages] == ["preview", "no spin", "optimized"]
+    assert stats.success
+    assert stats.iterations == sum(stage["iterations"] for stage in stats.stages) > 0
+    assert stats.rhs_evals > stats.sensitivity_rhs_evals > 0
+    assert stats.simulations > 0
+    assert stats.wall_time > 0
+
+
+def test_calculate_many_hits_every_reachable_target():
+    targets = [(2.2, 0.3, 0.05, 30, 20), (1.9, -0.4, 0.1, -50, 0), (2.5, 0.0, 0.1, 0, 0), (2.6, 0, 0.0, 100, 0)]
+    params, residuals, converged = trajectory.calculate_many(targets)
+
+    assert converged.tolist() == [True, True, True, False]  # the last one needs more than v_max
+    assert np.abs(residuals[converged]).max() < 1e-3
+    for target, launch in zip(targets[:3], params):
+        x_landing, y_landing, z_net = simulate_landing(*launch)
+        assert (x_landing, y_landing, z_net - trajectory.NET_HEIGHT) == pytest.approx(target[:3], abs=2e-3)
+        assert launch[3:] == pytest.approx((0, trajectory.omega_max * target[3] / 100,
+                                            trajectory.omega_max * target[4] / 100))
+
+
+def test_calculate_many_residuals_describe_the_returned_launch():
+    targets = [(1.5, 0.7, 0.0, 0, 100), (2.7, -0.7, 0.0, 100, 100)]
+    params, residuals, converged = trajectory.calculate_many(targets, iterations=5)
+
+    assert not converged.any()
+    for target, launch, residual in zip(targets, params, residuals):
+        x_landing, y_landing, z_net = simulate_landing(*launch)
+        miss = (x_landing - target[0], y_landing - target[1], z_net - trajectory.NET_HEIGHT - target[2])
+        assert residual == pytest.approx(miss, abs=5e-4)
+
+
+def test_start_guesses_spread_around_the_initial_guess():
+    guess = (10.0, 1.0, 1.5, 50.0, 200.0, 0.0)
+    guesses = trajectory._start_guesses(guess, 4)
+
+    assert len(guesses) == 4
+    assert guesses[0] == pytest.approx(guess)
+    assert all(start[3:] == guess[3:] for start in guesses)
+    assert len({start[2] for start in guesses}) == 4
+
+
+def test_multi_start_recovers_from_a_bad_local_minimum():
+    target = (2.15, 0.57, 0.15, -60, 0)  # single start SLSQP ends far off the target
+    with ProcessPoolExecutor(max_workers=4, mp_context=multiprocessing.get_context("spawn")) as executor:
+        stats = trajectory.SolveStats()
+        params = trajectory.solve(*target, multi_start=4, executor=executor, stats=stats)
+
+    x_landing, y_landing, z_net = simulate_landing(*params)
+    assert (x_landing, y_landing) == pytest.approx(target[:2], abs=5e-3)
+    assert z_net > trajectory.NET_HEIGHT
+    assert [stage["stage"] for stage in stats.stages] == ["preview", "optimized"]
+    assert stats.rhs_evals > 0
@@ -1,3 +1,5 @@
+import logging
+
 from shiny import App, ui, reactive, render, session
 
 # Import panel modules
@@ -10,6 +12,9 @@ from calibrate_panel import ui_calibrate, server_calibrate
 from dev_panel import ui_dev, server_dev
 
 
+# Solver statistics and other module logs go to the console
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
 # Shiny UI layout
 app_ui = ui.page_fluid(
     ui.h2("Magnus WebUI"),
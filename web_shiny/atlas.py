@@ -0,0 +1,111 @@
+"""Memory-mapped atlas files: named arrays and JSON metadata in one file that processes map read-only.
+
+Layout: MAGIC, the length of the JSON header as a little endian uint64, the header (metadata and the dtype,
+shape and offset of every array) and the arrays, each aligned to ALIGNMENT bytes. Readers map the file with
+np.memmap, so every process that opens the same atlas shares its pages through the page cache instead of
+holding its own copy.
+"""
+import json
+import logging
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"RPATLAS1"
+ALIGNMENT = 64
+
+
+def _aligned(size):
+    return -(-size // ALIGNMENT) * ALIGNMENT
+
+
+def publish_atlas(path, arrays, metadata=None):
+    """Write arrays (name -> ndarray) and JSON-able metadata as the atlas at path.
+
+    The atlas is written to a temporary file next to path and moved over it with os.replace, so readers
+    open either the old or the new atlas, never a partial one. Processes that mapped the old atlas keep
+    using it until they open the new one.
+    """
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    header = dict(metadata=metadata or {}, arrays={})
+    offset = 0
+    for name, array in arrays.items():
+        header["arrays"][name] = dict(dtype=array.dtype.str, shape=list(array.shape), offset=offset)
+        offset += _aligned(array.nbytes)
+    encoded = json.dumps(header).encode()
+    start = _aligned(len(MAGIC) + 8 + len(encoded))
+
+    temporary = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temporary, "wb") as f:
+            f.write(MAGIC + struct.pack("<Q", len(encoded)) + encoded)
+            for name, array in arrays.items():
+                f.seek(start + header["arrays"][name]["offset"])
+                array.tofile(f)
+            f.truncate(start + offset)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+def open_atlas(path):
+    """(arrays, metadata) of the atlas at path, the arrays are read-only views of the mapped file"""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not an atlas file")
+        (length,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(length))
+
+    mapped = np.memmap(path, mode="r")
+    start = _aligned(len(MAGIC) + 8 + length)
+    arrays = {name: np.ndarray(spec["shape"], np.dtype(spec["dtype"]), buffer=mapped, offset=start + spec["offset"])
+              for name, spec in header["arrays"].items()}
+    return arrays, header["metadata"]
+
+
+def _identity(path):
+    """Changes whenever a new atlas is published at path, None if there is none"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class AtlasWatcher:
+    """load(path) of the atlas at path, loaded again when a new atlas is published over it.
+
+    current() looks at the file at most every `interval` seconds and returns None while there is no atlas.
+    Callers that still hold the previous value keep a valid mapping of the previous file.
+    """
+
+    def __init__(self, path, load, interval=1.0):
+        self.path = path
+        self.load = load
+        self.interval = interval
+
+        self._lock = threading.Lock()
+        self._identity = None
+        self._value = None
+        self._checked = None
+
+    def current(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._checked is None or now - self._checked >= self.interval:
+                self._checked = now
+                identity = _identity(self.path)
+                if identity != self._identity:
+                    if self._identity is not None:
+                        logger.info(f"{self.path} was published again, mapping the new atlas")
+                    self._identity = identity
+                    self._value = self.load(self.path) if identity is not None else None
+            return self._value
@@ -0,0 +1,173 @@
+"""Solve a CSV of targets offline and write the launch and robot settings of each one.
+
+    python batch_targets.py drill.csv -o drill_settings.csv --presets presets.json
+
+The input has target_x, target_y and net_clearance columns in m, topspin and sidespin in % of omega_max, and
+optionally a name column. The rows are solved in chunks with calculate_many() on a process pool, which keeps
+the requested spin and only solves the launch velocity, so every launch is one the presets can set. The
+output repeats the input and adds the launch velocity and spin, the preset fields (speed, spin_angle,
+spin_strength, pan, tilt) that magnus_model maps the launch to, whether those are within the robot limits, and
+how far the launch misses the target. With --presets the rows that converged, clear the net and are within
+the robot limits are also added to a presets file, under their names, that the Presets panel loads, all rows
+with --include-failed. Exits with status 1 when a target failed one of those checks.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from magnus_model import SETTINGS as PRESET_FIELDS, launch_to_settings, within_limits
+
+TARGET_FIELDS = ("target_x", "target_y", "net_clearance", "topspin", "sidespin")
+LAUNCH_FIELDS = ("vx0", "vy0", "vz0", "omega_x", "omega_y", "omega_z")
+
+CHUNK = 25  # targets per calculate_many() call, small enough to report progress and spread over workers
+
+
+def solve_chunk(targets):
+    """(params, converged, miss in m, clears net) of the launch to each target, runs on a worker.
+
+    Each launch is flown once more with simulate_landing(), so the miss and the net check describe the launch
+    that is written even for targets that did not converge.
+    """
+    from trajectory import NET_HEIGHT, calculate_many, simulate_landing
+
+    params, _, converged = calculate_many(targets)
+    results = []
+    for (target_x, target_y, *_), row, ok in zip(targets, params, converged):
+        x_landing, y_landing, z_net = simulate_landing(*row)
+        results.append((tuple(map(float, row)), bool(ok), float(np.hypot(x_landing - target_x, y_landing - target_y)),
+                        bool(z_net >= NET_HEIGHT)))
+    return results
+
+
+def read_targets(path):
+    """(names, targets) of a targets CSV, raises ValueError on a missing column or a value that is no number"""
+    names, targets = [], []
+    with open(path, newline="") as f:
+        for line, row in enumerate(csv.DictReader(f), start=2):
+            try:
+                targets.append(tuple(float(row[field]) for field in TARGET_FIELDS))
+            except KeyError as e:
+                raise ValueError(f"{path} has no {e} column")
+            except (TypeError, ValueError):
+                raise ValueError(f"{path}:{line}: targets need numbers in {', '.join(TARGET_FIELDS)}")
+            names.append(row.get("name") or f"target {len(targets)}")
+    return names, targets
+
+
+def solve_targets(targets, workers=None, executor=None, chunk=CHUNK):
+    """solve_chunk() of every `chunk` targets in parallel on executor, a spawn process pool of `workers` by
+    default. Prints the progress as chunks finish, returns the results in the order of targets.
+    """
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+    results = [None] * len(targets)
+    done = 0
+    start = time.perf_counter()
+    try:
+        futures = {executor.submit(solve_chunk, targets[first:first + chunk]): first
+                   for first in range(0, len(targets), chunk)}
+        for future in as_completed(futures):
+            chunk_results = future.result()
+            results[futures[future]:futures[future] + len(chunk_results)] = chunk_results
+            done += len(chunk_results)
+            elapsed = time.perf_counter() - start
+            remaining = elapsed / done * (len(targets) - done)
+            print(f"[Batch] {done}/{len(targets)} solved in {elapsed:.0f}s, about {remaining:.0f}s left")
+    finally:
+        if own_executor:
+            executor.shutdown(cancel_futures=True)
+    return results
+
+
+def settings_rows(names, targets, results):
+    """One output row per target, with its launch parameters and preset fields"""
+    rows = []
+    for name, target, (params, converged, miss, clears_net) in zip(names, targets, results):
+        preset = launch_to_settings(params)
+        rows.append(dict(
+            name=name,
+            **dict(zip(TARGET_FIELDS, target)),
+            **{field: round(value, 4) for field, value in zip(LAUNCH_FIELDS, params)},
+            **{field: round(value, 1) for field, value in preset.items()},
+            within_limits=within_limits(preset),
+            converged=converged,
+            miss=round(miss, 4),
+            clears_net=clears_net,
+        ))
+    return rows
+
+
+def feasible(row):
+    """Whether the row converged, clears the net and the robot can be set to its preset"""
+    return bool(row["converged"] and row["clears_net"] and row["within_limits"])
+
+
+def write_settings(path, rows):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def add_presets(path, rows):
+    """Add the preset fields of rows to the presets file at path, replacing presets of the same name"""
+    presets = {}
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            presets = json.load(f)
+    for row in rows:
+        presets[row["name"]] = {field: row[field] for field in PRESET_FIELDS}
+    with open(path, "w") as f:
+        json.dump(presets, f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("targets", help="CSV with " + ", ".join(TARGET_FIELDS) + " and optionally name columns")
+    parser.add_argument("-o", "--output", help="settings CSV, <targets>_settings.csv by default")
+    parser.add_argument("--presets", help="also add the feasible rows to this presets file, e.g. presets.json")
+    parser.add_argument("--include-failed", action="store_true",
+                        help="add rows that did not converge, hit the net or exceed the robot limits as presets too")
+    parser.add_argument("--workers", type=int, default=None, help="solver processes, one per CPU by default")
+    args = parser.parse_args(argv)
+
+    try:
+        names, targets = read_targets(args.targets)
+    except (OSError, ValueError) as e:
+        print(f"[Batch] {e}")
+        return 1
+    if not targets:
+        print(f"[Batch] no targets in {args.targets}")
+        return 1
+
+    print(f"[Batch] solving {len(targets)} targets from {args.targets}")
+    rows = settings_rows(names, targets, solve_targets(targets, args.workers))
+
+    output = args.output or os.path.splitext(args.targets)[0] + "_settings.csv"
+    write_settings(output, rows)
+    print(f"[Batch] settings saved to {output}")
+    if args.presets:
+        presets = rows if args.include_failed else [row for row in rows if feasible(row)]
+        add_presets(args.presets, presets)
+        print(f"[Batch] {len(presets)} presets added to {args.presets}")
+
+    failed = [row["name"] for row in rows if not feasible(row)]
+    if failed:
+        print(f"[Batch] {len(failed)} targets did not converge, hit the net or exceed the robot limits, see the "
+              f"converged, clears_net and within_limits columns")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
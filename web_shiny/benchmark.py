@@ -0,0 +1,255 @@
+"""Performance benchmarks for trajectory.py.
+
+Times the app startup, single simulations, find_landing, full calculate() solves and one calculate_many()
+batch over a fixed grid of targets and spins, counts right hand side evaluations and optimizer iterations,
+measures the landing error of every integrator profile and the cost of one objective gradient, and compares
+everything with a stored baseline.
+
+    python benchmark.py                    # run and compare with benchmark_baseline.json
+    python benchmark.py --update-baseline  # run 5 times and store the medians as the new baseline
+
+Counts are deterministic and compared tightly, wall times depend on the host and get a looser tolerance,
+and wall times of microbenchmarks (below MICRO_TIME) a looser one still. The baseline stores the
+median wall times of several runs. Exits with status 1 when a metric regressed.
+"""
+import argparse
+import functools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+import scipy
+import scipy.optimize
+
+import trajectory
+
+BASELINE_FILE = "benchmark_baseline.json"
+RESULTS_FILE = "benchmark_results.json"
+
+# Fixed launches for the single simulation benchmarks: (vx0, vy0, vz0, omega_x, omega_y, omega_z)
+LAUNCHES = [
+    (12, 0, 1, 0, 0, 0),
+    (10, 1, 2, 0, 200, 0),
+    (14, -1.5, 0, 100, -200, 0),
+    (8, 0.5, 3, -100, 400, 50),
+    (6, -0.5, 2.5, 0, -400, 0),
+]
+
+# Fixed grid for the calculate() benchmarks: (target_x, target_y, net_clearance, topspin, sidespin)
+TARGETS = [
+    (x, y, 0.05, topspin, sidespin)
+    for x in (1.9, 2.5)
+    for y in (-0.4, 0.4)
+    for topspin, sidespin in ((0, 0), (50, 0), (-50, 30))
+]
+
+# Loaded on first use by the Target panel, the app must start without them
+HEAVY_MODULES = ("scipy", "matplotlib", "trajectory")
+
+TIME_METRICS = ("wall_time",)  # and every metric ending with it
+MICRO_TIME = 0.01  # s, shorter timings swing by up to 2x with the CPU frequency from run to run
+UNCOMPARED = ("calls", "converged", "clears_net")
+
+
+def best_time(function, repeats, number=1):
+    """Fastest of `repeats` runs of `number` calls, in seconds per call"""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        times.append((time.perf_counter() - start) / number)
+    return min(times)
+
+
+def import_app():
+    """Seconds to import app.py in a fresh interpreter, and the HEAVY_MODULES it loaded"""
+    code = ("import json, sys, time\n"
+            "start = time.perf_counter()\n"
+            "import app\n"
+            "print(json.dumps([time.perf_counter() - start, [m for m in %r if m in sys.modules]]))" % (HEAVY_MODULES,))
+    output = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            capture_output=True, text=True, check=True).stdout
+    wall_time, loaded = json.loads(output.splitlines()[-1])
+    return wall_time, loaded
+
+
+def bench_startup(repeats):
+    runs = [import_app() for _ in range(repeats)]
+    loaded = runs[-1][1]
+    if loaded:
+        print(f"[Benchmark] app startup imports {', '.join(loaded)}")
+    return dict(calls=1, wall_time=min(wall_time for wall_time, _ in runs), heavy_imports=len(loaded))
+
+
+def bench_simulate_trajectory(repeats):
+    stats = trajectory.SolveStats()
+    for launch in LAUNCHES:
+        trajectory.simulate_trajectory(*launch, stats=stats)
+    wall_time = best_time(lambda: [trajectory.simulate_trajectory(*launch) for launch in LAUNCHES], repeats)
+    return dict(calls=len(LAUNCHES), wall_time=wall_time, rhs_evals=stats.rhs_evals)
+
+
+def bench_find_landing(repeats):
+    samples = [trajectory.simulate_trajectory(*launch) for launch in LAUNCHES]
+    wall_time = best_time(lambda: [trajectory.find_landing(*sample) for sample in samples], repeats, number=100)
+    return dict(calls=len(samples), wall_time=wall_time)
+
+
+def bench_calculate(repeats, **options):
+    per_target = []
+    for target in TARGETS:
+        stats = trajectory.SolveStats()
+        start = time.perf_counter()
+        trajectory.calculate(*target, stats=stats, **options)
+        wall_time = time.perf_counter() - start
+        _, _, z_net = trajectory.simulate_landing(*stats.params)
+        per_target.append(dict(
+            target=target,
+            wall_time=wall_time,
+            rhs_evals=stats.rhs_evals,
+            sensitivity_rhs_evals=stats.sensitivity_rhs_evals,
+            optimizer_iterations=stats.iterations,
+            success=stats.success,
+            clears_net=bool(z_net >= trajectory.NET_HEIGHT),
+        ))
+
+    totals = {key: sum(result[key] for result in per_target)
+              for key in ("wall_time", "rhs_evals", "sensitivity_rhs_evals", "optimizer_iterations", "clears_net")}
+    return dict(calls=len(TARGETS), **totals, per_target=per_target)
+
+
+def bench_calculate_many(repeats):
+    stats = trajectory.SolveStats()
+    _, _, converged = trajectory.calculate_many(TARGETS, stats=stats)
+    wall_time = best_time(lambda: trajectory.calculate_many(TARGETS), repeats)
+    return dict(calls=len(TARGETS), wall_time=wall_time, rhs_evals=stats.rhs_evals, converged=int(converged.sum()))
+
+
+def bench_profiles(repeats):
+    errors = trajectory.profile_errors(LAUNCHES)
+    return dict(calls=len(LAUNCHES), **{f"{profile}_{metric}": value for profile, result in errors.items()
+                                        for metric, value in result.items() if profile != "accurate"})
+
+
+def bench_gradients(repeats):
+    """Wall time of one objective gradient at every launch, analytic or by finite differences"""
+    args = TARGETS[0]
+    gradients = dict(
+        sensitivity=lambda launch: trajectory.error_function_and_grad(launch, *args),
+        sensitivity_fast=lambda launch: trajectory.error_function_and_grad(launch, *args, profile="fast"),
+        batch_fd=lambda launch: trajectory.error_function_and_batch_grad(launch, *args),
+        serial_fd=lambda launch: scipy.optimize.approx_fprime(launch, trajectory.error_function, 1e-6, *args),
+    )
+    launches = [np.array(launch, dtype=float) for launch in LAUNCHES]
+    return dict(calls=len(launches), **{
+        f"{name}_wall_time": best_time(lambda: [gradient(launch) for launch in launches], repeats) / len(launches)
+        for name, gradient in gradients.items()})
+
+
+BENCHMARKS = {
+    "startup": bench_startup,
+    "simulate_trajectory": bench_simulate_trajectory,
+    "find_landing": bench_find_landing,
+    "profiles": bench_profiles,
+    "calculate": bench_calculate,
+    "calculate_fast": functools.partial(bench_calculate, profile="fast"),
+    "calculate_least_squares": functools.partial(bench_calculate, optimizer="least_squares"),
+    "gradients": bench_gradients,
+    "calculate_fd": functools.partial(bench_calculate, optimizer="SLSQP_fd"),
+    "calculate_many": bench_calculate_many,
+}
+
+
+def run(names=None, repeats=3):
+    cases = {}
+    for name, benchmark in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        print(f"[Benchmark] {name}...")
+        cases[name] = benchmark(repeats)
+
+    return dict(
+        python=platform.python_version(),
+        numpy=np.__version__,
+        scipy=scipy.__version__,
+        machine=platform.machine(),
+        cases=cases,
+    )
+
+
+def median_results(runs):
+    """The first of several run() results, with the median wall times of all of them"""
+    results = json.loads(json.dumps(runs[0]))
+    for name, case in results["cases"].items():
+        for metric, value in case.items():
+            if metric.endswith(TIME_METRICS) and isinstance(value, (int, float)):
+                case[metric] = float(np.median([run["cases"][name][metric] for run in runs]))
+    return results
+
+
+def compare(results, baseline, time_tolerance=0.25, count_tolerance=0.1, micro_time_tolerance=1.0):
+    """Regressions of results against baseline, as a list of messages"""
+    regressions = []
+    for name, case in results["cases"].items():
+        reference = baseline["cases"].get(name)
+        if reference is None:
+            continue
+        for metric, value in case.items():
+            if metric in UNCOMPARED or not isinstance(value, (int, float)) or metric not in reference:
+                continue
+            tolerance = count_tolerance
+            if metric.endswith(TIME_METRICS):
+                tolerance = micro_time_tolerance if reference[metric] < MICRO_TIME else time_tolerance
+            limit = reference[metric] * (1 + tolerance)
+            status = "REGRESSION" if value > limit else "ok"
+            print(f"[Benchmark] {name}.{metric}: {value:.6g} (baseline {reference[metric]:.6g}) {status}")
+            if value > limit:
+                regressions.append(f"{name}.{metric} {value:.6g} > {limit:.6g}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("cases", nargs="*", help=f"benchmarks to run, out of {', '.join(BENCHMARKS)}")
+    parser.add_argument("--output", default=RESULTS_FILE)
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--time-tolerance", type=float, default=0.25)
+    parser.add_argument("--count-tolerance", type=float, default=0.1)
+    parser.add_argument("--micro-time-tolerance", type=float, default=1.0)
+    parser.add_argument("--baseline-runs", type=int, default=5, help="runs whose median the baseline stores")
+    args = parser.parse_args(argv)
+
+    runs = args.baseline_runs if args.update_baseline else 1
+    results = median_results([run(args.cases, args.repeats) for _ in range(runs)])
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"[Benchmark] results saved to {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"[Benchmark] baseline saved to {args.baseline}")
+        return 0
+
+    try:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print(f"[Benchmark] no baseline at {args.baseline}, run with --update-baseline to create one")
+        return 0
+
+    regressions = compare(results, baseline, args.time_tolerance, args.count_tolerance, args.micro_time_tolerance)
+    for regression in regressions:
+        print(f"[Benchmark] regression: {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
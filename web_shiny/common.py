@@ -3,7 +3,6 @@ from shiny import ui, reactive, render, session
 import requests
 import json
 import os
-import matplotlib.pyplot as plt
 
 # Robot URL
 robot_url = "http://10.0.0.47"
@@ -0,0 +1,99 @@
+import numpy as np
+
+from trajectory import simulate_batch, NET_HEIGHT, NET_X, TABLE_LENGTH, TABLE_WIDTH
+
+
+class LaunchNoise:
+    """Random launch errors of the robot, as standard deviations.
+
+    speed is relative to the launch speed (motor speed variation), elevation and azimuth are aiming errors
+    in degrees, spin is relative to the spin magnitude and spin_absolute (rad/s) is added on every axis so
+    that spinless launches wobble too.
+    """
+
+    def __init__(self, speed=0.02, elevation=0.5, azimuth=0.5, spin=0.05, spin_absolute=5.0):
+        self.speed = speed
+        self.elevation = elevation
+        self.azimuth = azimuth
+        self.spin = spin
+        self.spin_absolute = spin_absolute
+
+    def sample(self, params, samples, rng):
+        """(samples, 3) launch velocities and spin vectors scattered around params"""
+        v0 = np.asarray(params[:3], dtype=float)
+        omega = np.asarray(params[3:], dtype=float)
+
+        speed = np.linalg.norm(v0) * (1 + self.speed * rng.standard_normal(samples))
+        elevation = np.arcsin(v0[2] / np.linalg.norm(v0)) + np.radians(self.elevation) * rng.standard_normal(samples)
+        azimuth = np.arctan2(v0[1], v0[0]) + np.radians(self.azimuth) * rng.standard_normal(samples)
+        velocities = np.column_stack([
+            speed * np.cos(elevation) * np.cos(azimuth),
+            speed * np.cos(elevation) * np.sin(azimuth),
+            speed * np.sin(elevation),
+        ])
+
+        spins = (omega * (1 + self.spin * rng.standard_normal((samples, 1)))
+                 + self.spin_absolute * rng.standard_normal((samples, 3)))
+        return velocities, spins
+
+
+class Dispersion:
+    """Landing scatter of a noisy launch.
+
+    landings holds the (x, y) landing point of every sample (nan for the ones still flying), mean and
+    covariance describe the scatter of the landed ones. clears_net is the fraction of samples that pass
+    over the net and on_table the fraction that also lands on the opponent's half.
+    """
+
+    def __init__(self, landings, z_net):
+        self.landings = landings
+        self.z_net = z_net
+
+        landed = landings[np.isfinite(landings).all(axis=1)]
+        self.mean = landed.mean(axis=0) if len(landed) else np.full(2, np.nan)
+        self.covariance = np.cov(landed, rowvar=False) if len(landed) > 1 else np.full((2, 2), np.nan)
+
+        clears = z_net >= NET_HEIGHT
+        x, y = landings[:, 0], landings[:, 1]
+        on_table = clears & (x >= NET_X) & (x <= TABLE_LENGTH) & (np.abs(y) <= TABLE_WIDTH / 2)
+        self.clears_net = clears.mean()
+        self.on_table = on_table.mean()
+
+    def ellipse(self, confidence=0.95):
+        """(width, height, angle) of the covariance ellipse holding `confidence` of the landings.
+
+        Width and height are full axis lengths in meters, angle is the direction of the width axis in
+        degrees from +x, as taken by matplotlib.patches.Ellipse.
+        """
+        scale = np.sqrt(-2 * np.log(1 - confidence))  # chi-square quantile with 2 degrees of freedom
+        variances, axes = np.linalg.eigh(self.covariance)
+        width, height = 2 * scale * np.sqrt(np.maximum(variances[::-1], 0))
+        angle = np.degrees(np.arctan2(axes[1, 1], axes[0, 1]))
+        return width, height, angle
+
+    def ellipse_points(self, confidence=0.95, points=64):
+        """(points, 2) outline of ellipse(), for plotting as a line"""
+        scale = np.sqrt(-2 * np.log(1 - confidence))
+        angles = np.linspace(0, 2 * np.pi, points)
+        circle = np.column_stack([np.cos(angles), np.sin(angles)])
+        variances, axes = np.linalg.eigh(self.covariance)
+        return self.mean + scale * (circle * np.sqrt(np.maximum(variances, 0))) @ axes.T
+
+    def summary(self, confidence=0.95):
+        """ellipse_points() and the clears_net and on_table fractions as a JSON-able dict"""
+        return dict(ellipse=self.ellipse_points(confidence).tolist(), clears_net=float(self.clears_net),
+                    on_table=float(self.on_table))
+
+
+def dispersion(params, noise=None, samples=2000, seed=None, stats=None):
+    """Landing Dispersion of the launch params (vx0, vy0, vz0, omega_x, omega_y, omega_z) under noise.
+
+    All samples are integrated as one simulate_batch() call, a few thousand take a few tens of
+    milliseconds. Pass a seed for reproducible scatter.
+    """
+    noise = noise if noise is not None else LaunchNoise()
+    rng = np.random.default_rng(seed)
+
+    velocities, spins = noise.sample(params, samples, rng)
+    x_landing, y_landing, z_net = simulate_batch(velocities, spins, stats=stats)
+    return Dispersion(np.column_stack([x_landing, y_landing]), z_net)
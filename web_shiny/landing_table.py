@@ -0,0 +1,214 @@
+import logging
+import os
+
+import numpy as np
+
+from atlas import AtlasWatcher, open_atlas, publish_atlas
+from trajectory import simulate_batch, physics_constants, spin_vector, NET_HEIGHT
+
+logger = logging.getLogger(__name__)
+
+# Memory mapped atlas shared by every process that loads it, see atlas.py. A .npz path is read into memory.
+LANDING_TABLE_FILE = "landing_table.atlas"
+
+# Launch parameter grid sampled by build()
+SPEEDS = np.linspace(3, 15, 25)  # m/s
+ELEVATIONS = np.linspace(-20, 45, 27)  # degrees above horizontal
+AZIMUTHS = np.linspace(-20, 20, 17)  # degrees, positive towards +y
+TOPSPINS = np.linspace(-100, 100, 9)  # % of omega_max
+SIDESPINS = np.linspace(-100, 100, 5)  # % of omega_max
+PATH_TIMES = np.arange(1, 16) * 0.1  # s, flight times of the downsampled paths
+
+
+def launch_velocity(speed, elevation, azimuth):
+    """Velocity vector(s) for a launch speed and direction in degrees"""
+    elevation = np.radians(elevation)
+    azimuth = np.radians(azimuth)
+    return np.stack([
+        speed * np.cos(elevation) * np.cos(azimuth),
+        speed * np.cos(elevation) * np.sin(azimuth),
+        speed * np.sin(elevation),
+    ], axis=-1)
+
+
+class LandingTable:
+    """Launch parameter samples with their landing point and net clearance, used to invert the flight model.
+
+    landing has shape (topspins, sidespins, speeds, elevations, azimuths, 3) and holds x, y and clearance
+    over the net for each sampled launch. Clearance is nan for balls that land before the net.
+
+    paths, when sampled, has shape (topspins, sidespins, speeds, elevations, azimuths, path times, 3) and
+    holds the ball position at each of path_times, nan once it has landed, in float16 (mm resolution).
+    Loaded from an atlas, all arrays are read-only views of the mapped file.
+    """
+
+    def __init__(self, speeds, elevations, azimuths, topspins, sidespins, landing, constants, paths=None,
+                 path_times=None):
+        self.speeds = speeds
+        self.elevations = elevations
+        self.azimuths = azimuths
+        self.topspins = topspins
+        self.sidespins = sidespins
+        self.landing = landing
+        self.constants = constants
+        self.paths = paths
+        self.path_times = path_times
+
+    @classmethod
+    def build(cls, speeds=SPEEDS, elevations=ELEVATIONS, azimuths=AZIMUTHS, topspins=TOPSPINS,
+              sidespins=SIDESPINS, path_times=PATH_TIMES, chunk=20000):
+        speed, elevation, azimuth = np.meshgrid(speeds, elevations, azimuths, indexing="ij")
+        v0 = launch_velocity(speed.ravel(), elevation.ravel(), azimuth.ravel())
+
+        landing = np.empty((len(topspins), len(sidespins), v0.shape[0], 3), dtype=np.float32)
+        paths = np.empty((len(topspins), len(sidespins), v0.shape[0], len(path_times), 3), dtype=np.float16)
+        for i, topspin in enumerate(topspins):
+            for j, sidespin in enumerate(sidespins):
+                omega = spin_vector(topspin, sidespin)
+                for start in range(0, len(v0), chunk):
+                    x_landing, y_landing, z_net, sampled = simulate_batch(v0[start:start + chunk], omega,
+                                                                          path_times=path_times)
+                    landing[i, j, start:start + chunk] = np.column_stack([x_landing, y_landing, z_net - NET_HEIGHT])
+                    paths[i, j, start:start + chunk] = sampled
+                logger.info(f"Sampled topspin {topspin:.0f}% sidespin {sidespin:.0f}%")
+
+        landing = landing.reshape(len(topspins), len(sidespins), *speed.shape, 3)
+        paths = paths.reshape(len(topspins), len(sidespins), *speed.shape, len(path_times), 3)
+        return cls(speeds, elevations, azimuths, topspins, sidespins, landing, physics_constants(), paths,
+                   np.asarray(path_times))
+
+    def save(self, path=LANDING_TABLE_FILE):
+        """Publish the table as an atlas, or write a compressed .npz without the paths"""
+        if not str(path).endswith(".npz"):
+            arrays = dict(speeds=self.speeds, elevations=self.elevations, azimuths=self.azimuths,
+                          topspins=self.topspins, sidespins=self.sidespins, landing=self.landing)
+            if self.paths is not None:
+                arrays.update(paths=self.paths, path_times=self.path_times)
+            publish_atlas(path, arrays, dict(constants=self.constants))
+            return
+
+        np.savez_compressed(
+            path,
+            speeds=self.speeds,
+            elevations=self.elevations,
+            azimuths=self.azimuths,
+            topspins=self.topspins,
+            sidespins=self.sidespins,
+            landing=self.landing,
+            constant_names=list(self.constants.keys()),
+            constant_values=list(self.constants.values()),
+        )
+
+    @classmethod
+    def load(cls, path=LANDING_TABLE_FILE):
+        """Load a table from disk, raises ValueError if it was built with different physics constants.
+
+        An atlas is mapped read-only, without copying it into this process.
+        """
+        if not str(path).endswith(".npz"):
+            arrays, metadata = open_atlas(path)
+            if metadata["constants"] != physics_constants():
+                raise ValueError(f"{path} was built for different physics constants, rebuild it")
+            return cls(arrays["speeds"], arrays["elevations"], arrays["azimuths"], arrays["topspins"],
+                       arrays["sidespins"], arrays["landing"], metadata["constants"], arrays.get("paths"),
+                       arrays.get("path_times"))
+
+        with np.load(path) as data:
+            constants = dict(zip(data["constant_names"].tolist(), data["constant_values"].tolist()))
+            if constants != physics_constants():
+                raise ValueError(f"{path} was built for different physics constants, rebuild it")
+            return cls(data["speeds"], data["elevations"], data["azimuths"], data["topspins"],
+                       data["sidespins"], data["landing"], constants)
+
+    def _nearest(self, i, j, wanted):
+        """Flat index of the sample of one spin slice that lands closest to wanted.
+
+        A scan of the slice, about 0.3ms. Unlike a KD-tree it keeps nothing per process, the mapped atlas is
+        all the memory a worker needs.
+        """
+        offsets = self.landing[i, j].reshape(-1, 3) - wanted.astype(np.float32)
+        return np.nanargmin(np.einsum("ij,ij->i", offsets, offsets))
+
+    def _invert_slice(self, i, j, wanted):
+        """(speed, elevation, azimuth) landing at wanted=(x, y, clearance) for one spin sample.
+
+        The nearest sample gives the grid cell, an affine fit of launch parameters over its grid neighbours
+        interpolates between samples. Also returns the fitted derivative of the launch parameters with
+        respect to (x, y, clearance).
+        """
+        slice_shape = self.landing.shape[2:5]
+        centre = np.unravel_index(self._nearest(i, j, wanted), slice_shape)
+
+        block = tuple(slice(max(c - 1, 0), c + 2) for c in centre)
+        axes = np.meshgrid(self.speeds[block[0]], self.elevations[block[1]], self.azimuths[block[2]], indexing="ij")
+        inputs = np.stack(axes, axis=-1).reshape(-1, 3)
+        outputs = self.landing[i, j][block].reshape(-1, 3)
+        ok = np.isfinite(outputs).all(axis=1)
+        if ok.sum() < 4:
+            return inputs[len(inputs) // 2], np.zeros((3, 3))
+
+        design = np.column_stack([outputs[ok], np.ones(ok.sum())])
+        coefficients, *_ = np.linalg.lstsq(design, inputs[ok], rcond=None)
+        return np.append(wanted, 1) @ coefficients, coefficients[:3]
+
+    def query(self, target_x, target_y, net_clearance, topspin, sidespin, corrections=4, tolerance=1e-3, stats=None):
+        """Launch parameters (vx0, vy0, vz0, omega_x, omega_y, omega_z) that land on the target.
+
+        Spin is given in % of omega_max like in calculate(). The launch direction is blended bilinearly
+        between the neighbouring spin samples, then each correction simulates the launch once and applies
+        a Newton step with the table derivative, until the miss is below tolerance (m).
+        """
+        wanted = np.array([target_x, target_y, net_clearance])
+        omega = spin_vector(topspin, sidespin)
+
+        launch = np.zeros(3)
+        derivative = np.zeros((3, 3))
+        for i, wi in _neighbours(self.topspins, topspin):
+            for j, wj in _neighbours(self.sidespins, sidespin):
+                slice_launch, slice_derivative = self._invert_slice(i, j, wanted)
+                launch += wi * wj * slice_launch
+                derivative += wi * wj * slice_derivative
+
+        for _ in range(corrections):
+            x_landing, y_landing, z_net = simulate_batch(launch_velocity(*launch), omega, stats=stats)
+            miss = np.array([x_landing[0], y_landing[0], z_net[0] - NET_HEIGHT]) - wanted
+            if not np.isfinite(miss).all() or np.abs(miss).max() < tolerance:
+                break
+            launch = launch - miss @ derivative
+
+        return tuple(launch_velocity(*launch)) + tuple(omega)
+
+
+def _neighbours(grid, value):
+    """Indices and linear interpolation weights of the grid points around value"""
+    if len(grid) == 1:
+        return [(0, 1.0)]
+    value = min(max(value, grid[0]), grid[-1])
+    upper = min(max(np.searchsorted(grid, value), 1), len(grid) - 1)
+    weight = (value - grid[upper - 1]) / (grid[upper] - grid[upper - 1])
+    return [(upper - 1, 1 - weight), (upper, weight)]
+
+
+def load_landing_table(path=LANDING_TABLE_FILE):
+    """Load the landing table if it was built and is still valid, None otherwise.
+
+    Use landing_tables() instead to follow rebuilds of the table while the app runs.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        return LandingTable.load(path)
+    except ValueError as e:
+        logger.warning(f"{e}")
+        return None
+
+
+def landing_tables(path=LANDING_TABLE_FILE, interval=1.0):
+    """AtlasWatcher whose current() is the landing table, mapped again after every rebuild"""
+    return AtlasWatcher(path, load_landing_table, interval)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    LandingTable.build().save()
+    print(f"[LandingTable] published to {LANDING_TABLE_FILE}, running apps map it within a second")
@@ -0,0 +1,192 @@
+"""Mapping between the Magnus robot settings and the launch physics of trajectory.py.
+
+The robot takes speed (%), spin_angle (degrees), spin_strength (%), pan and tilt (degrees). On the device
+Magnus.set_settings splits the spin into topspin and sidespin fractions, Launcher.configure mixes them with
+the speed into the raw speeds of the top, left and right motors and the Aimer turns to pan and tilt. This
+module mirrors that and maps the motor speeds to the ball speed and spin with a Calibration fitted to
+measured launches. Both directions are closed form and take arrays:
+
+    params = settings_to_launch(speed, spin_angle, spin_strength, pan, tilt)  # (..., 6) like calculate()
+    settings = launch_to_settings(params)  # dict of speed, spin_angle, spin_strength, pan, tilt
+
+Spin follows the axes of calculate() (see trajectory.spin_vector()): the top motor against the other two
+spins the ball about y, the right motor against the left one about z, which curves it sideways. The launcher
+cannot spin the ball about the x axis it flies along, so launch_to_settings() ignores omega_x, which the
+solver keeps at 0. The spin axes are taken as fixed, pan and tilt turn the real ones by up to 15 and 35
+degrees.
+"""
+import functools
+import json
+import os
+
+import numpy as np
+
+from trajectory import omega_max, simulate_landing, v_max, SIDESPIN_AXIS, TOPSPIN_AXIS
+
+# Launcher.configure of esp_app/parts.py
+RAW_MINIMUM = 5  # raw motor speed of the lowest speed setting above 0, slower motors stall
+RAW_MAXIMUM = 9  # raw motor speed at speed 100%
+COS30 = 0.866
+SIN30 = 0.5
+RAW_SPIN = 3 * 2 * COS30 * RAW_MINIMUM / 5  # raw speed difference at full spin
+
+# Aimer of esp_app/parts.py
+PAN_LIMITS = (-15, 15)  # degrees
+TILT_LIMITS = (-25, 35)  # degrees
+
+SETTINGS = ("speed", "spin_angle", "spin_strength", "pan", "tilt")
+
+# Resolution of the Control panel sliders, launch settings are rounded to it before they are shown or used
+PRESET_STEPS = dict(speed=1, spin_angle=10, spin_strength=10, pan=1, tilt=1)
+
+# Nominal ball speed of the slowest running motors (speed just above 0), the lowest shots the solver picks
+# over the net need about 3 m/s. Speed 100% launches at v_max and full spin_strength spins at omega_max.
+NOMINAL_MIN_SPEED = 2.0  # m/s
+
+# Measured launches in CALIBRATION_FILE replace these nominal ones:
+# (speed %, spin_strength % of topspin, ball speed m/s, spin rad/s)
+CALIBRATION_FILE = "magnus_calibration.json"
+NOMINAL_CALIBRATION = [
+    (speed, spin_strength, NOMINAL_MIN_SPEED + (v_max - NOMINAL_MIN_SPEED) * speed / 100,
+     omega_max * spin_strength / 100)
+    for speed, spin_strength in [(10, 0), (40, 0), (70, 0), (100, 0), (70, 50), (70, 100)]
+]
+
+
+def motor_speeds(speed, topspin, sidespin):
+    """Raw (top, left, right) motor speeds that Launcher.configure sets, topspin and sidespin in [-1, 1]"""
+    speed = np.clip(speed, 0, 100)
+    topspin = np.clip(topspin, -1, 1)
+    sidespin = np.clip(sidespin, -1, 1)
+
+    base = np.where(speed == 0, 0, (RAW_MAXIMUM - RAW_MINIMUM) * speed / 100 + RAW_MINIMUM)
+    top = topspin * RAW_SPIN
+    side = sidespin * RAW_SPIN
+
+    left = (3 * base - top - 3 / 2 * side / COS30) / 3
+    right = left + side / COS30
+    top_speed = top + SIN30 * (left + right)
+    return np.maximum(top_speed, 0), np.maximum(left, 0), np.maximum(right, 0)
+
+
+def _spin_fractions(spin_angle, spin_strength):
+    """(topspin, sidespin) fractions like Magnus.set_settings splits them"""
+    angle = np.radians(spin_angle)
+    return np.cos(angle) * spin_strength / 100, np.sin(angle) * spin_strength / 100
+
+
+class Calibration:
+    """Ball speed and spin produced by the motors.
+
+    The ball speed is speed_gain * mean raw motor speed + speed_offset, and each spin component is
+    spin_gain times the raw speed difference that makes it: the top motor against the mean of the others
+    for topspin, right against left (projected by cos30) for sidespin.
+    """
+
+    def __init__(self, speed_gain, speed_offset, spin_gain):
+        self.speed_gain = speed_gain
+        self.speed_offset = speed_offset
+        self.spin_gain = spin_gain
+
+    @classmethod
+    def fit(cls, samples):
+        """Least squares fit to measured launches, rows of (speed %, spin_strength % of topspin, ball speed
+        m/s, spin rad/s)"""
+        speed, spin_strength, ball_speed, spin = np.asarray(samples, dtype=float).T
+        top, left, right = motor_speeds(speed, spin_strength / 100, 0)
+        mean = (top + left + right) / 3
+        (speed_gain, speed_offset), *_ = np.linalg.lstsq(np.column_stack([mean, np.ones_like(mean)]), ball_speed,
+                                                         rcond=None)
+        difference = top - (left + right) / 2
+        spin_gain = difference @ spin / (difference @ difference)
+        return cls(float(speed_gain), float(speed_offset), float(spin_gain))
+
+
+@functools.lru_cache(maxsize=4)
+def load_calibration(path=CALIBRATION_FILE):
+    """Calibration fitted to the "samples" of the JSON file at path, or to NOMINAL_CALIBRATION without one"""
+    samples = NOMINAL_CALIBRATION
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            samples = json.load(f)["samples"]
+    return Calibration.fit(samples)
+
+
+def _unwrap(values):
+    """Plain floats for scalar inputs, arrays otherwise"""
+    return {name: value.item() if np.ndim(value) == 0 else value for name, value in values.items()}
+
+
+def settings_to_launch(speed, spin_angle, spin_strength, pan, tilt, calibration=None):
+    """(..., 6) launch parameters (vx0, vy0, vz0, omega_x, omega_y, omega_z) of robot settings"""
+    calibration = calibration or load_calibration()
+    top, left, right = motor_speeds(speed, *_spin_fractions(spin_angle, spin_strength))
+
+    mean = (top + left + right) / 3
+    ball_speed = np.where(mean > 0, calibration.speed_gain * mean + calibration.speed_offset, 0)
+    spin = {TOPSPIN_AXIS: calibration.spin_gain * (top - (left + right) / 2),
+            SIDESPIN_AXIS: calibration.spin_gain * (right - left) * COS30}
+
+    pan = np.radians(np.clip(pan, *PAN_LIMITS))
+    tilt = np.radians(np.clip(tilt, *TILT_LIMITS))
+    return np.stack(np.broadcast_arrays(
+        ball_speed * np.cos(tilt) * np.cos(pan),
+        ball_speed * np.cos(tilt) * np.sin(pan),
+        ball_speed * np.sin(tilt),
+        *(spin.get(axis, 0.0) for axis in range(3)),
+    ), axis=-1)
+
+
+def launch_to_settings(params, calibration=None):
+    """Robot settings of (..., 6) launch parameters, the inverse of settings_to_launch() within the limits.
+
+    Returns a dict of SETTINGS, floats for a single launch. Check within_limits() before sending them, the
+    speed comes out below 0 for launches slower than the motors can go and spin about the flight axis
+    (omega_x) is dropped.
+    """
+    calibration = calibration or load_calibration()
+    params = np.moveaxis(np.asarray(params, dtype=float), -1, 0)
+    vx0, vy0, vz0 = params[:3]
+
+    mean = (np.sqrt(vx0**2 + vy0**2 + vz0**2) - calibration.speed_offset) / calibration.speed_gain
+    topspin = params[3 + TOPSPIN_AXIS] / (calibration.spin_gain * RAW_SPIN)
+    sidespin = params[3 + SIDESPIN_AXIS] / (calibration.spin_gain * RAW_SPIN)
+    return _unwrap(dict(
+        speed=100 * (mean - RAW_MINIMUM) / (RAW_MAXIMUM - RAW_MINIMUM),
+        spin_angle=np.degrees(np.arctan2(sidespin, topspin)),
+        spin_strength=100 * np.hypot(topspin, sidespin),
+        pan=np.degrees(np.arctan2(vy0, vx0)),
+        tilt=np.degrees(np.arctan2(vz0, np.hypot(vx0, vy0))),
+    ))
+
+
+def within_limits(settings):
+    """Whether the robot can launch with settings: speed and spin in range, the aim within the Aimer limits
+    and no motor below RAW_MINIMUM, where Launcher.configure warns that it stalls"""
+    top, left, right = motor_speeds(settings["speed"], *_spin_fractions(settings["spin_angle"],
+                                                                        settings["spin_strength"]))
+    ok = ((0 < np.asarray(settings["speed"])) & (np.asarray(settings["speed"]) <= 100)
+          & (np.asarray(settings["spin_strength"]) <= 100 + 1e-6)
+          & (PAN_LIMITS[0] <= np.asarray(settings["pan"])) & (np.asarray(settings["pan"]) <= PAN_LIMITS[1])
+          & (TILT_LIMITS[0] <= np.asarray(settings["tilt"])) & (np.asarray(settings["tilt"]) <= TILT_LIMITS[1])
+          & (np.minimum(np.minimum(top, left), right) >= RAW_MINIMUM - 1e-9))
+    return ok.item() if ok.ndim == 0 else ok
+
+
+def preset_report(params, spread=False):
+    """What the Target panel shows about a solved launch as a JSON-able dict, computed where the solve runs.
+
+    preset holds the settings of params rounded to PRESET_STEPS, landing the (x, y) where the robot lands
+    them and within_limits whether it can be set to them. With spread, spread holds the Dispersion.summary()
+    of params, None otherwise.
+    """
+    settings = launch_to_settings(params)
+    preset = {name: round(settings[name] / step) * step for name, step in PRESET_STEPS.items()}
+    x_landing, y_landing, _ = simulate_landing(*settings_to_launch(**preset))
+    report = dict(preset=preset, landing=[float(x_landing), float(y_landing)],
+                  within_limits=bool(within_limits(preset)), spread=None)
+    if spread:
+        from dispersion import dispersion
+
+        report["spread"] = dispersion(params, seed=0).summary()
+    return report
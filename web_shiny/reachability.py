@@ -0,0 +1,118 @@
+import functools
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# The solver and scipy are imported when a map is built, clients of the solver service only receive maps
+
+REACH_CELL = 0.05  # m, side of the table cells in a reachability map
+EXTRA_CLEARANCES = (0, 0.1, 0.3)  # m, net clearances above the requested one that are tried for each cell
+
+
+class ReachabilityMap:
+    """Cells of the opponent's half that the launcher can hit with the given net clearance and spin.
+
+    speed has shape (x cells, y cells) and holds the lowest launch speed found to land on the centre of each
+    cell, nan where it cannot be hit within v_max.
+    """
+
+    def __init__(self, x_edges, y_edges, speed, net_clearance, topspin, sidespin):
+        self.x_edges = x_edges
+        self.y_edges = y_edges
+        self.speed = speed
+        self.net_clearance = net_clearance
+        self.topspin = topspin
+        self.sidespin = sidespin
+
+    @classmethod
+    def build(cls, net_clearance, topspin, sidespin, cell=REACH_CELL, extra_clearances=EXTRA_CLEARANCES,
+              passes=3, stats=None, cancel=None):
+        """Solve the launch to every cell centre at once with calculate_many().
+
+        A cell is reachable when the ball can land on it and pass over the net with at least net_clearance,
+        so it is solved for net_clearance plus each of extra_clearances and keeps the lowest launch speed.
+        Setting the cancel event stops the build with trajectory.SolveCancelled between Newton iterations.
+        """
+        from trajectory import NET_X, TABLE_LENGTH, TABLE_WIDTH
+
+        x_edges = np.linspace(NET_X, TABLE_LENGTH, round((TABLE_LENGTH - NET_X) / cell) + 1)
+        y_edges = np.linspace(-TABLE_WIDTH / 2, TABLE_WIDTH / 2, round(TABLE_WIDTH / cell) + 1)
+        x, y = np.meshgrid((x_edges[:-1] + x_edges[1:]) / 2, (y_edges[:-1] + y_edges[1:]) / 2, indexing="ij")
+
+        speeds = [_solve_cells(x, y, net_clearance + extra, topspin, sidespin, passes, stats, cancel)
+                  for extra in extra_clearances]
+        with np.errstate(invalid="ignore"):
+            speed = np.fmin.reduce(speeds)
+        return cls(x_edges, y_edges, speed, net_clearance, topspin, sidespin)
+
+    def _cell(self, x, y):
+        i = np.searchsorted(self.x_edges, x) - 1
+        j = np.searchsorted(self.y_edges, y) - 1
+        if 0 <= i < self.speed.shape[0] and 0 <= j < self.speed.shape[1]:
+            return i, j
+        return None
+
+    def speed_at(self, x, y):
+        """Launch speed needed to land at (x, y), nan if out of reach or off the opponent's half"""
+        cell = self._cell(x, y)
+        return self.speed[cell] if cell is not None else np.nan
+
+    def reachable(self, x, y):
+        return bool(np.isfinite(self.speed_at(x, y)))
+
+
+def _solve_cells(x, y, net_clearance, topspin, sidespin, passes, stats, cancel):
+    """Launch speed to the (x, y) cell centres with exactly net_clearance, nan where out of reach.
+
+    Unreachable cells next to reachable ones are solved again up to `passes` times, starting from the
+    solution of their reachable neighbour, so that the map has no holes where the first guess was poor.
+    """
+    from scipy.ndimage import binary_dilation, distance_transform_edt
+    from trajectory import calculate_many, v_max
+
+    targets = np.column_stack([x.ravel(), y.ravel(), np.full(x.size, net_clearance),
+                               np.full(x.size, topspin), np.full(x.size, sidespin)])
+
+    solve = functools.partial(calculate_many, iterations=8, rtol=1e-3, tolerance=5e-3, stats=stats, cancel=cancel)
+    params, _, converged = solve(targets)
+    for _ in range(passes):
+        speed = np.linalg.norm(params[:, :3], axis=1)
+        reachable = (converged & (speed <= v_max)).reshape(x.shape)
+        if reachable.all() or not reachable.any():
+            break
+        _, nearest = distance_transform_edt(~reachable, return_indices=True)
+        nearest = np.ravel_multi_index(nearest, x.shape).ravel()
+        retry = np.flatnonzero((binary_dilation(reachable, np.ones((3, 3))) & ~reachable).ravel())
+        params[retry], _, converged[retry] = solve(targets[retry], initial=params[nearest[retry], :3])
+
+    speed = np.linalg.norm(params[:, :3], axis=1)
+    speed[~converged | (speed > v_max)] = np.nan
+    return speed.reshape(x.shape)
+
+
+# Built maps by (net clearance, topspin, sidespin), least recently used first. Kept by hand rather than with
+# lru_cache, the cancel event of a build is not part of its key
+_maps = OrderedDict()
+_maps_lock = threading.Lock()
+MAPS_KEPT = 32
+
+
+def reachability_map(net_clearance, topspin, sidespin, cancel=None):
+    """ReachabilityMap for the settings, built once per parameter set (net clearance rounded to 5mm).
+
+    Setting the cancel event stops a build with trajectory.SolveCancelled, nothing is kept of it then.
+    """
+    key = (round(net_clearance / 0.005) * 0.005, round(topspin), round(sidespin))
+    with _maps_lock:
+        if key in _maps:
+            _maps.move_to_end(key)
+            return _maps[key]
+
+    reach = ReachabilityMap.build(*key, cancel=cancel)
+    with _maps_lock:
+        reach = _maps.setdefault(key, reach)  # the one built first by another thread wins
+        _maps.move_to_end(key)
+        while len(_maps) > MAPS_KEPT:
+            _maps.popitem(last=False)
+    return reach
@@ -0,0 +1,69 @@
+"""Work and outcome of a solve, kept apart from trajectory.py so that clients of the solver service can
+read solver results without loading scipy."""
+
+
+class SolveStats:
+    """Work done by one solve, filled in by solve_staged() when passed as stats.
+
+    rhs_evals counts evaluations of the equations of motion, including the ones made while integrating
+    the sensitivities (also counted in sensitivity_rhs_evals). simulations counts integrated trajectories,
+    a batch of N counts N. stages holds one dict per refinement with its wall time, optimizer iterations,
+    convergence status and message.
+    """
+
+    def __init__(self):
+        self.rhs_evals = 0
+        self.sensitivity_rhs_evals = 0
+        self.simulations = 0
+        self.stages = []
+        self.params = None
+        self.success = None
+        self.message = ""
+
+    def add_work(self, other):
+        """Count the evaluations and simulations of another SolveStats, e.g. from a worker process"""
+        self.rhs_evals += other.rhs_evals
+        self.sensitivity_rhs_evals += other.sensitivity_rhs_evals
+        self.simulations += other.simulations
+
+    def add_stage(self, stage, wall_time, iterations=0, success=True, message=""):
+        self.stages.append(dict(stage=stage, wall_time=wall_time, iterations=iterations, success=success,
+                                message=message))
+
+    @property
+    def iterations(self):
+        return sum(stage["iterations"] for stage in self.stages)
+
+    @property
+    def wall_time(self):
+        return sum(stage["wall_time"] for stage in self.stages)
+
+    def as_dict(self):
+        return dict(
+            rhs_evals=self.rhs_evals,
+            sensitivity_rhs_evals=self.sensitivity_rhs_evals,
+            simulations=self.simulations,
+            iterations=self.iterations,
+            wall_time=self.wall_time,
+            success=self.success,
+            message=self.message,
+            params=self.params,
+            stages=self.stages,
+        )
+
+    @classmethod
+    def from_dict(cls, values):
+        """SolveStats back from as_dict(), e.g. as received from the solver service"""
+        stats = cls()
+        for name in ("rhs_evals", "sensitivity_rhs_evals", "simulations", "success", "message", "stages"):
+            setattr(stats, name, values[name])
+        stats.params = tuple(values["params"]) if values["params"] is not None else None
+        return stats
+
+    def summary(self):
+        stages = ", ".join(f"{stage['stage']} {stage['wall_time'] * 1000:.0f}ms"
+                           + (f" ({stage['iterations']} it)" if stage["iterations"] else "")
+                           for stage in self.stages)
+        status = "converged" if self.success else f"not converged: {self.message}"
+        return (f"{self.wall_time * 1000:.0f}ms, {status}, {self.simulations} simulations, "
+                f"{self.rhs_evals} RHS evaluations, {self.iterations} iterations [{stages}]")
@@ -0,0 +1,201 @@
+import json
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from trajectory import physics_constants
+
+logger = logging.getLogger(__name__)
+
+SOLVER_CACHE_FILE = "solver_cache.sqlite"
+CACHE_VERSION = 2  # bump when solutions of the same target and solver change for other reasons than physics
+
+# Quantization step of (target_x m, target_y m, net_clearance m, topspin %, sidespin %) in cache keys
+CACHE_RESOLUTION = (0.01, 0.01, 0.005, 1, 1)
+
+
+class SolverCache:
+    """Memoizes solved launch parameters, keyed by the quantized target and the solver that found them.
+
+    Lookups go through an in-memory tier first and then an SQLite file on disk that survives app restarts. The
+    app, the solver service and batch workers can share the file, each solution is written as a row of its own
+    and is seen by the others on their next lookup. Both tiers evict the least recently used solution once
+    they reach their size limit. Entries are dropped automatically when the physics constants of
+    trajectory.py or CACHE_VERSION change, call invalidate() to drop them for any other reason. Only put
+    solutions that converged and clear the net, every get() returns them as final.
+    """
+
+    def __init__(self, path=SOLVER_CACHE_FILE, memory_size=256, disk_size=5000, resolution=CACHE_RESOLUTION):
+        self.path = path
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.resolution = resolution
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._constants = physics_constants()
+        self._db = self._open()
+
+    def key(self, target_x, target_y, net_clearance, topspin, sidespin, solver=""):
+        """solver names the optimizer and integrator profile, see trajectory.solver_name()"""
+        values = (target_x, target_y, net_clearance, topspin, sidespin)
+        return "|".join([str(round(value / step)) for value, step in zip(values, self.resolution)] + [solver])
+
+    def get(self, target_x, target_y, net_clearance, topspin, sidespin, solver=""):
+        """Cached launch parameters or None"""
+        key = self.key(target_x, target_y, net_clearance, topspin, sidespin, solver)
+        with self._lock:
+            self._check_physics()
+            with self._db:
+                # the row is used again, also when the memory tier answers
+                self._db.execute("UPDATE solutions SET used = (SELECT MAX(used) FROM solutions) + 1 WHERE key = ?",
+                                 (key,))
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+            row = self._db.execute("SELECT params FROM solutions WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                params = tuple(json.loads(row[0]))
+                self._remember(key, params)
+                self.hits += 1
+                self.disk_hits += 1
+                return params
+            self.misses += 1
+            return None
+
+    def put(self, target_x, target_y, net_clearance, topspin, sidespin, params, solver=""):
+        key = self.key(target_x, target_y, net_clearance, topspin, sidespin, solver)
+        params = tuple(float(value) for value in params)
+        with self._lock:
+            self._check_physics()
+            self._remember(key, params)
+            with self._db:
+                self._db.execute("INSERT OR REPLACE INTO solutions VALUES "
+                                 "(?, ?, (SELECT COALESCE(MAX(used), 0) FROM solutions) + 1)",
+                                 (key, json.dumps(params)))
+                self._db.execute("DELETE FROM solutions WHERE key IN "
+                                 "(SELECT key FROM solutions ORDER BY used DESC LIMIT -1 OFFSET ?)", (self.disk_size,))
+
+    def invalidate(self):
+        """Drop every cached solution, in memory and on disk"""
+        with self._lock:
+            self._memory.clear()
+            self._constants = physics_constants()
+            self._reset()
+
+    def stats(self):
+        with self._lock:
+            disk_entries, = self._db.execute("SELECT COUNT(*) FROM solutions").fetchone()
+        return dict(
+            hits=self.hits,
+            disk_hits=self.disk_hits,
+            misses=self.misses,
+            memory_entries=len(self._memory),
+            disk_entries=disk_entries,
+        )
+
+    def _remember(self, key, params):
+        self._memory[key] = params
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _check_physics(self):
+        """Invalidation hook, solutions are only valid for the physics constants they were solved with"""
+        constants = physics_constants()
+        if constants != self._constants:
+            logger.info("Physics constants changed, dropping cached solutions")
+            self._memory.clear()
+            self._constants = constants
+            self._reset()
+
+    def _stamp(self):
+        return json.dumps(dict(version=CACHE_VERSION, constants=self._constants), sort_keys=True)
+
+    def _reset(self):
+        """Drop the solutions on disk and record the physics constants of the ones put from now on"""
+        with self._db:
+            self._db.execute("DELETE FROM solutions")
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('stamp', ?)", (self._stamp(),))
+
+    def _open(self):
+        """Connection to the cache file, or to an in-memory database if the file cannot be used"""
+        try:
+            return self._connect(self.path)
+        except sqlite3.Error as e:
+            logger.warning(f"Could not open {self.path}, caching in memory only: {e}")
+            return self._connect(":memory:")
+
+    def _connect(self, path):
+        # shared by the solver threads, self._lock serializes them and SQLite locks out other processes
+        db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        try:
+            db.execute("PRAGMA journal_mode = WAL")  # readers do not wait for writers
+            db.execute("PRAGMA synchronous = NORMAL")
+            with db:
+                db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+                db.execute("CREATE TABLE IF NOT EXISTS solutions (key TEXT PRIMARY KEY, params TEXT, used INTEGER)")
+                db.execute("CREATE INDEX IF NOT EXISTS solutions_used ON solutions (used)")
+            row = db.execute("SELECT value FROM meta WHERE name = 'stamp'").fetchone()
+        except sqlite3.Error:
+            db.close()
+            raise
+        self._db = db
+        if row is None or row[0] != self._stamp():
+            self._reset()
+        return db
+
+
+# Distance weights of (target_x m, target_y m, net_clearance m, topspin %, sidespin %) between solved targets
+WARM_START_SCALE = (1, 1, 1, 0.005, 0.005)
+
+
+class WarmStarts:
+    """Recently converged solutions, to start the optimizer from the nearest one instead of a fixed guess.
+
+    Holds at most `size` solutions and looks them up with a linear scan, at this size that is cheaper than
+    keeping a KD-tree up to date after every solve.
+    """
+
+    def __init__(self, size=512, scale=WARM_START_SCALE, max_distance=0.3):
+        self.size = size
+        self.scale = np.array(scale, dtype=float)
+        self.max_distance = max_distance
+
+        self._lock = threading.Lock()
+        self._targets = np.empty((size, 5))
+        self._params = np.empty((size, 6))
+        self._count = 0
+        self._next = 0
+
+    def add(self, target_x, target_y, net_clearance, topspin, sidespin, params):
+        with self._lock:
+            self._targets[self._next] = (target_x, target_y, net_clearance, topspin, sidespin)
+            self._params[self._next] = params
+            self._next = (self._next + 1) % self.size
+            self._count = min(self._count + 1, self.size)
+
+    def nearest(self, target_x, target_y, net_clearance, topspin, sidespin):
+        """Launch parameters of the closest solved target within max_distance, None if there is none"""
+        with self._lock:
+            if not self._count:
+                return None
+            offsets = (self._targets[:self._count] - (target_x, target_y, net_clearance, topspin, sidespin)) * self.scale
+            distances = np.sqrt(np.einsum("ij,ij->i", offsets, offsets))
+            closest = np.argmin(distances)
+            if distances[closest] > self.max_distance:
+                return None
+            return tuple(self._params[closest])
+
+    def clear(self):
+        with self._lock:
+            self._count = 0
+            self._next = 0
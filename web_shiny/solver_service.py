@@ -0,0 +1,331 @@
+"""Stand-alone trajectory solver service.
+
+Runs the Target panel solves and reachability maps on a pool of worker processes behind a small JSON over
+HTTP API, so that heavy solves do not slow down the Shiny process and solving scales on its own:
+
+    python solver_service.py --port 8765 --workers 4 --queue-size 32
+
+Start the app with SOLVER_SERVICE_URL=http://localhost:8765 to make the Target panel a client of it.
+
+    POST /solve    {"target_x", "target_y", "net_clearance", "topspin", "sidespin", "refine", "spread"}
+                   -> {"trajectory": {"t", "x", "y", "z"}, "stats": SolveStats.as_dict(), "clears_net",
+                       "report": magnus_model.preset_report()}
+    POST /reach    {"net_clearance", "topspin", "sidespin"} -> {"x_edges", "y_edges", "speed"}
+    GET  /health   -> {"status": "ok", "workers", "in_flight"}
+    GET  /metrics  -> request, cache, coalescing and queue counters
+
+Identical requests that arrive while one is running share its result, and converged solutions that clear
+the net are kept in a SolverCache. At most queue_size distinct requests wait or run at once, the others get 503.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import requests
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8765
+SOLVE_FIELDS = ("target_x", "target_y", "net_clearance", "topspin", "sidespin")
+REACH_FIELDS = ("net_clearance", "topspin", "sidespin")
+SOLVE_OPTIONS = dict(profile="fast", optimizer="least_squares")  # the same as the local Target panel solves
+
+
+class QueueFull(Exception):
+    """Raised by SolverService when queue_size requests are already waiting or running"""
+
+
+class SolverServiceError(Exception):
+    """Error reply of the solver service, raised by SolverClient"""
+
+
+# Landing tables (mapped, shared between workers) and warm starts of a worker, loaded by its first solve
+_worker = {}
+_worker_lock = threading.Lock()
+
+
+def _worker_state():
+    with _worker_lock:
+        if not _worker:
+            from landing_table import landing_tables
+            from solver_cache import WarmStarts
+
+            _worker.update(tables=landing_tables(), warm_starts=WarmStarts())
+        return _worker
+
+
+def _solution(trajectory, stats, clears_net, spread):
+    from magnus_model import preset_report
+
+    t, x, y, z = trajectory
+    return dict(trajectory=dict(t=t.tolist(), x=x.tolist(), y=y.tolist(), z=z.tolist()), stats=stats.as_dict(),
+                clears_net=clears_net, report=preset_report(stats.params, spread))
+
+
+def solve_target(target_x, target_y, net_clearance, topspin, sidespin, refine=True, spread=False):
+    """Solved trajectory to the target, its stats and preset report as a JSON-able dict, runs on a worker"""
+    from trajectory import calculate, simulate_landing, SolveStats, NET_HEIGHT
+
+    state = _worker_state()
+    stats = SolveStats()
+    trajectory = calculate(target_x, target_y, net_clearance, topspin, sidespin,
+                           table=state["tables"].current(), refine=refine, warm_starts=state["warm_starts"],
+                           stats=stats, **SOLVE_OPTIONS)
+    _, _, z_net = simulate_landing(*stats.params)
+    return _solution(trajectory, stats, bool(z_net >= NET_HEIGHT), spread)
+
+
+def reach_map(net_clearance, topspin, sidespin):
+    """reachability_map() as a JSON-able dict, unreachable cells are None, runs on a worker"""
+    from reachability import reachability_map
+
+    reach = reachability_map(net_clearance, topspin, sidespin)
+    speed = reach.speed.astype(object)
+    speed[np.isnan(reach.speed)] = None
+    return dict(x_edges=reach.x_edges.tolist(), y_edges=reach.y_edges.tolist(), speed=speed.tolist())
+
+
+class SolverService:
+    """Runs solve_target() and reach_map() on executor, a spawn process pool of `workers` by default.
+
+    Requests with the same arguments as a running one wait for its result instead of being solved again.
+    Solutions are looked up in cache (a SolverCache) when one is given, and refined solutions that converged
+    and clear the net are added to it.
+    """
+
+    def __init__(self, workers=2, queue_size=32, cache=None, executor=None):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.cache = cache
+        self.executor = executor or ProcessPoolExecutor(max_workers=workers,
+                                                        mp_context=multiprocessing.get_context("spawn"))
+        self.counters = dict(requests=0, completed=0, failed=0, cache_hits=0, coalesced=0, rejected=0)
+        self.busy_time = 0.0  # s, summed over completed requests
+
+        self._lock = threading.Lock()
+        self._pending = {}  # request key -> Future of the running request
+
+    def solve(self, target_x, target_y, net_clearance, topspin, sidespin, refine=True, spread=False, timeout=None):
+        target = (target_x, target_y, net_clearance, topspin, sidespin)
+        self._count("requests")
+        if self.cache is not None:
+            cached = self._cached_solution(target, spread)
+            if cached is not None:
+                return cached
+
+        result = self._submit(("solve",) + target + (refine, spread), solve_target, *target, refine,
+                              spread).result(timeout)
+        if self.cache is not None and refine and result["stats"]["success"] and result["clears_net"]:
+            self.cache.put(*target, result["stats"]["params"], solver=self._solver_name())
+        return result
+
+    def reach(self, net_clearance, topspin, sidespin, timeout=None):
+        self._count("requests")
+        return self._submit(("reach", net_clearance, topspin, sidespin), reach_map,
+                            net_clearance, topspin, sidespin).result(timeout)
+
+    def health(self):
+        with self._lock:
+            return dict(status="ok", workers=self.workers, in_flight=len(self._pending))
+
+    def metrics(self):
+        with self._lock:
+            completed = self.counters["completed"]
+            return dict(self.counters, in_flight=len(self._pending), queue_size=self.queue_size,
+                        workers=self.workers, mean_time=self.busy_time / completed if completed else None,
+                        cache=self.cache.stats() if self.cache is not None else None)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _count(self, counter):
+        with self._lock:
+            self.counters[counter] += 1
+
+    @staticmethod
+    def _solver_name():
+        from trajectory import solver_name
+
+        return solver_name(**SOLVE_OPTIONS)
+
+    def _cached_solution(self, target, spread):
+        from trajectory import simulate_trajectory, SolveStats
+
+        params = self.cache.get(*target, solver=self._solver_name())
+        if params is None:
+            return None
+        self._count("cache_hits")
+        stats = SolveStats()
+        stats.add_stage("cached", 0)
+        stats.params, stats.success, stats.message = params, True, "cached solution"
+        return _solution(simulate_trajectory(*params, stats=stats), stats, True, spread)
+
+    def _submit(self, key, function, *args):
+        """Future of function(*args), shared with a running request of the same key"""
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None:
+                self.counters["coalesced"] += 1
+                return future
+            if len(self._pending) >= self.queue_size:
+                self.counters["rejected"] += 1
+                raise QueueFull(f"{len(self._pending)} requests already queued")
+            future = self.executor.submit(function, *args)
+            self._pending[key] = future
+
+        start = time.perf_counter()
+        future.add_done_callback(lambda done: self._finished(key, done, time.perf_counter() - start))
+        return future
+
+    def _finished(self, key, future, wall_time):
+        with self._lock:
+            del self._pending[key]
+            if future.cancelled() or future.exception() is not None:
+                self.counters["failed"] += 1
+            else:
+                self.counters["completed"] += 1
+                self.busy_time += wall_time
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Routes requests to the SolverService of the server"""
+
+    def do_GET(self):
+        service = self.server.service
+        if self.path == "/health":
+            self._reply(200, service.health())
+        elif self.path == "/metrics":
+            self._reply(200, service.metrics())
+        else:
+            self._reply(404, dict(error=f"unknown path {self.path}"))
+
+    def do_POST(self):
+        service = self.server.service
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if self.path == "/solve":
+                result = service.solve(*(float(body[field]) for field in SOLVE_FIELDS),
+                                       refine=bool(body.get("refine", True)), spread=bool(body.get("spread", False)))
+            elif self.path == "/reach":
+                result = service.reach(*(float(body[field]) for field in REACH_FIELDS))
+            else:
+                self._reply(404, dict(error=f"unknown path {self.path}"))
+                return
+        except QueueFull as e:
+            self._reply(503, dict(error=str(e)))
+        except KeyError as e:
+            self._reply(400, dict(error=f"missing field {e}"))
+        except (ValueError, TypeError) as e:
+            self._reply(400, dict(error=str(e)))
+        except Exception as e:
+            logger.exception(f"{self.path} failed")
+            self._reply(500, dict(error=f"{type(e).__name__}: {e}"))
+        else:
+            self._reply(200, result)
+
+    def _reply(self, status, payload):
+        data = json.dumps(payload, default=_json_default).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def make_server(service, host="127.0.0.1", port=DEFAULT_PORT):
+    """HTTP server for service, each request is handled on its own thread. Port 0 picks a free port."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+class SolverClient:
+    """Client of a solver service, with the same results as solving locally"""
+
+    def __init__(self, url, timeout=120):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def solve(self, target_x, target_y, net_clearance, topspin, sidespin, refine=True, spread=False):
+        """(t, x, y, z) arrays of the solved trajectory, its SolveStats and magnus_model.preset_report()"""
+        from solve_stats import SolveStats
+
+        result = self._request("post", "/solve", dict(
+            target_x=target_x, target_y=target_y, net_clearance=net_clearance, topspin=topspin, sidespin=sidespin,
+            refine=refine, spread=spread))
+        trajectory = tuple(np.array(result["trajectory"][name]) for name in ("t", "x", "y", "z"))
+        return trajectory, SolveStats.from_dict(result["stats"]), result["report"]
+
+    def reach(self, net_clearance, topspin, sidespin):
+        """ReachabilityMap of the settings"""
+        from reachability import ReachabilityMap
+
+        result = self._request("post", "/reach", dict(net_clearance=net_clearance, topspin=topspin,
+                                                       sidespin=sidespin))
+        speed = np.array(result["speed"], dtype=float)  # None becomes nan
+        return ReachabilityMap(np.array(result["x_edges"]), np.array(result["y_edges"]), speed, net_clearance,
+                               topspin, sidespin)
+
+    def health(self):
+        return self._request("get", "/health")
+
+    def metrics(self):
+        return self._request("get", "/metrics")
+
+    def _request(self, method, path, payload=None):
+        response = requests.request(method, self.url + path, json=payload, timeout=self.timeout)
+        if not response.ok:
+            try:
+                error = response.json()["error"]
+            except (ValueError, KeyError):
+                error = response.text
+            raise SolverServiceError(f"{path} returned {response.status_code}: {error}")
+        return response.json()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=2, help="solver processes")
+    parser.add_argument("--queue-size", type=int, default=32, help="distinct requests waiting or running at once")
+    parser.add_argument("--no-cache", action="store_true", help="do not read or write the solver cache")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    cache = None
+    if not args.no_cache:
+        from solver_cache import SolverCache
+        cache = SolverCache()
+    service = SolverService(workers=args.workers, queue_size=args.queue_size, cache=cache)
+    server = make_server(service, args.host, args.port)
+    logger.info(f"Solver service on http://{args.host}:{server.server_port} with {args.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,11 @@
-from shiny import ui, reactive, render
-import matplotlib.pyplot as plt
-from trajectory import calculate
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from shiny import ui, reactive, render, req
 
 # Constants for table dimensions
 TABLE_LENGTH = 2.74  # meters
@@ -9,6 +14,16 @@ NET_HEIGHT = 0.1525  # meters
 
 ratio = TABLE_WIDTH / TABLE_LENGTH
 
+logger = logging.getLogger(__name__)
+
+# Solves run here, off the event loop, so other tabs and sessions stay responsive
+solver_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="solver")
+# Reachability maps take seconds to build, they get a worker of their own so that clicks never queue behind them
+reach_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reach")
+
+# Solve on a solver service (see solver_service.py) instead of in this process when set, e.g. http://localhost:8765
+SOLVER_SERVICE_URL = os.environ.get("SOLVER_SERVICE_URL")
+
 # UI for the Target panel
 def ui_target():
     return ui.nav_panel(
@@ -20,14 +35,66 @@ def ui_target():
                 }
             """)
         ),
-        ui.output_plot("plot", click=True, width="400px", height=f"{2*400*ratio:.0f}px"),
+        ui.include_js(os.path.join(os.path.dirname(__file__), "target_svg.js")),
+        ui.panel_conditional("!input.browser_render",
+                             ui.output_plot("plot", click=True, width="400px", height=f"{2*400*ratio:.0f}px")),
+        # Drawn by target_svg.js from the arrays sent by server_target, the server renders no image
+        ui.panel_conditional("input.browser_render", ui.div(id="target_svg")),
         ui.output_text("click_info"),
+        ui.output_text("solve_info"),
+        ui.output_text("preset_info"),
+        ui.input_action_button("use_preset", "Use launch settings"),
         ui.input_slider("net_clearance", "Net Clearance", min=0, max=30, value=5, step=1),
         ui.input_slider("topspin", "Back<-----spin----->Top", min=-100, max=100, value=0, step=5),
         ui.input_slider("sidespin", "Left<\tspin\tRight", min=-100, max=100, value=0, step=5),
+        ui.input_switch("refine", "Refine with optimizer", True),
+        ui.input_switch("spread", "Show landing spread", False),
+        ui.input_switch("browser_render", "Draw in browser", False),
     )
 
-def plot_table():
+class SharedSolver:
+    """Solver state shared by every session, loaded on first use.
+
+    The solver modules pull in scipy and the landing table is read from disk, so none of it is imported
+    when the app starts: the first session that opens the Target panel loads it on the solver pool.
+    With SOLVER_SERVICE_URL set only the client of the service is created, the rest stays None.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.cache = self.warm_starts = self.client = None
+        self._tables = None
+
+    @property
+    def table(self):
+        """Current landing table, every worker maps the same atlas and follows its rebuilds"""
+        return self._tables.current() if self._tables is not None else None
+
+    def load(self):
+        with self._lock:
+            if not self._loaded and SOLVER_SERVICE_URL:
+                from solver_service import SolverClient
+
+                self.client = SolverClient(SOLVER_SERVICE_URL)
+                self._loaded = True
+            if not self._loaded:
+                from landing_table import landing_tables
+                from solver_cache import SolverCache, WarmStarts
+
+                # Precomputed launch lookup, built with `python landing_table.py`
+                self._tables = landing_tables()
+                # Solutions shared by every session and kept across restarts
+                self.cache = SolverCache()
+                self.warm_starts = WarmStarts()
+                self._loaded = True
+        return self
+
+shared_solver = SharedSolver()
+
+def plot_table(reach=None):
+    import matplotlib.pyplot as plt
+
     fig, ax = plt.subplots(figsize=(6, 2*6*ratio), nrows=2, sharex=True)
     ax[0].plot((0, 0), (-TABLE_WIDTH / 2, TABLE_WIDTH / 2), color='blue', linestyle='-', lw=3)
     ax[0].plot((TABLE_LENGTH, TABLE_LENGTH), (-TABLE_WIDTH / 2, TABLE_WIDTH / 2), color='blue', linestyle='-', lw=3)
@@ -37,6 +104,8 @@ def plot_table():
     ax[0].plot((TABLE_LENGTH / 2, TABLE_LENGTH / 2), (-TABLE_WIDTH / 2, TABLE_WIDTH / 2), color='red', linestyle='-', lw=3)
     ax[0].fill_between((0, TABLE_LENGTH), (-TABLE_WIDTH / 2, -TABLE_WIDTH / 2), (TABLE_WIDTH / 2, TABLE_WIDTH / 2),
                      color="gray")
+    if reach is not None:
+        plot_reach(ax, reach)
 
     for spine in ax[0].spines.values():
         spine.set_visible(False)
@@ -56,31 +125,285 @@ def plot_table():
 
     return fig, ax
 
-def plot_trajectory(ax, x_vals, y_vals, z_vals):
+def plot_reach(ax, reach):
+    """Shade the reachable cells by the launch speed they need"""
+    return ax[0].pcolormesh(reach.x_edges, reach.y_edges, reach.speed.T, cmap="YlGn_r", alpha=0.6, vmin=0, vmax=15)
+
+class TablePlot:
+    """Table figure of one session, built once. Each render only replaces what was drawn on top of it.
+
+    The reachability shading is kept across renders and only redrawn when the map changes. The tight layout
+    is computed at the first render of every plot size and then frozen, which halves the cost of a render.
+    """
+
+    def __init__(self):
+        self.fig, self.ax = plot_table()
+        self._static = [set(axis.get_children()) for axis in self.ax]
+        self._reach = None
+        self._shading = None
+        self._layout_size = None
+
+    def reset(self, reach=None):
+        """Remove the trajectory, markers and titles of the last render, returns (fig, ax)"""
+        for axis, static in zip(self.ax, self._static):
+            for artist in axis.get_children():
+                if artist not in static and artist is not self._shading:
+                    artist.remove()
+            axis.set_title(" ")  # keeps room for a title in the layout
+
+        # render.plot resizes the figure to the output after this returns
+        size = tuple(self.fig.get_size_inches())
+        self.fig.set_layout_engine("none" if size == self._layout_size else "tight")
+        self._layout_size = size
+
+        if reach is not self._reach:
+            if self._shading is not None:
+                self._shading.remove()
+            self._shading = plot_reach(self.ax, reach) if reach is not None else None
+            self._reach = reach
+
+        return self.fig, self.ax
+
+    def close(self):
+        import matplotlib.pyplot as plt
+
+        plt.close(self.fig)
+
+def plot_trajectory(ax, x_vals, y_vals, z_vals, preview=False):
     valid = z_vals > 0
+    style = dict(color="orange", lw=4, alpha=0.75)
+    if preview:  # approximate, still being refined
+        style.update(linestyle="--", alpha=0.5)
+
+    ax[0].plot(x_vals[valid], y_vals[valid], **style)
+    ax[1].plot(x_vals[valid], z_vals[valid], **style)
+
+def trajectory_message(t_vals, x_vals, y_vals, z_vals, max_points=120):
+    """Trajectory downsampled to at most max_points above the table, as lists for send_custom_message"""
+    valid = z_vals > 0
+    valid[-1] = True  # the landing point
+    t_vals, x_vals, y_vals, z_vals = t_vals[valid], x_vals[valid], y_vals[valid], z_vals[valid]
+    speed = np.linalg.norm(np.gradient(np.stack([x_vals, y_vals, z_vals]), t_vals, axis=1), axis=0)
+
+    keep = np.unique(np.linspace(0, len(t_vals) - 1, min(max_points, len(t_vals))).round().astype(int))
+    return {name: np.round(values[keep], 3).tolist()
+            for name, values in dict(t=t_vals, x=x_vals, y=y_vals, z=z_vals, speed=speed).items()}
+
+def reach_message(reach):
+    """Reachability map as lists for send_custom_message, unreachable cells are None"""
+    if reach is None:
+        return None
+    speed = np.round(reach.speed, 2).astype(object)
+    speed[np.isnan(reach.speed)] = None
+    return dict(x_edges=np.round(reach.x_edges, 4).tolist(), y_edges=np.round(reach.y_edges, 4).tolist(),
+                speed=speed.tolist(), max_speed=15)
+
+class Refinements:
+    """Latest (stage, trajectory) of the running solve, handed from the solver thread to the plot"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._solve = 0
+        self._latest = None
+        self.version = 0
+
+    def start(self):
+        """Start tracking a new solve, refinements of older ones are ignored from now on"""
+        with self._lock:
+            self._solve += 1
+            self._latest = None
+            self.version += 1
+            return self._solve
+
+    def set(self, solve, stage, trajectory):
+        with self._lock:
+            if solve == self._solve:
+                self._latest = (stage, trajectory)
+                self.version += 1
+
+    def latest(self):
+        with self._lock:
+            return self._latest
+
+def solve_in_pool(x, y, net_clearance, topspin, sidespin, refine, spread, on_stage):
+    """Future of the final trajectory, its SolveStats and magnus_model.preset_report() on the solver pool, and
+    the event that cancels it. The report holds the landing spread when spread is set.
+
+    on_stage(stage, trajectory) is called from the solver thread for every refinement.
+    """
+    cancel = threading.Event()
 
-    ax[0].plot(x_vals[valid], y_vals[valid], color="orange", lw=4, alpha=0.75)
-    ax[1].plot(x_vals[valid], z_vals[valid], color="orange", lw=4, alpha=0.75)
+    def run():
+        solver = shared_solver.load()
+        if solver.client is not None:  # no intermediate refinements from the service
+            return solver.client.solve(x, y, net_clearance, topspin, sidespin, refine, spread)
+
+        from magnus_model import preset_report
+        from trajectory import calculate_staged, SolveStats
+
+        stats = SolveStats()
+        for stage, trajectory in calculate_staged(
+                x, y, net_clearance=net_clearance, topspin=topspin, sidespin=sidespin, table=solver.table,
+                refine=refine, cache=solver.cache, warm_starts=solver.warm_starts, cancel=cancel, stats=stats,
+                profile="fast", optimizer="least_squares"):
+            on_stage(stage, trajectory)
+        return trajectory, stats, preset_report(stats.params, spread)
+
+    return solver_pool.submit(run), cancel
+
+def build_reach(net_clearance, topspin, sidespin, cancel=None):
+    """reachability_map() on the reach pool, which also loads the solver for the first click. Setting cancel
+    stops a local build, the service finishes its own."""
+    solver = shared_solver.load()
+    if solver.client is not None:
+        return solver.client.reach(net_clearance, topspin, sidespin)
+
+    from reachability import reachability_map
+
+    return reachability_map(net_clearance, topspin, sidespin, cancel=cancel)
+
+def preset_text(target, report):
+    """Control panel settings of a magnus_model.preset_report() and how far they land from the target"""
+    preset = report["preset"]
+    x_landing, y_landing = report["landing"]
+    text = (f"Launch settings: speed {preset['speed']}%, spin {preset['spin_strength']}% at "
+            f"{preset['spin_angle']}°, pan {preset['pan']}°, tilt {preset['tilt']}°, "
+            f"landing {100 * np.hypot(x_landing - target[0], y_landing - target[1]):.0f}cm from the target")
+    return text if report["within_limits"] else text + " (outside the robot limits)"
 
 # Server logic for the Target panel
 def server_target(input, output, session):
     click_data = reactive.Value(None)
+    solving_for = reactive.Value(None)
+    out_of_reach = reactive.Value(None)
+    target_opened = reactive.Value(False)
+    refinements = Refinements()
+    table_plots = []  # the TablePlot of the session, built by the first PNG render
 
-    @output
-    @render.plot
-    def plot():
+    def table_plot():
+        if not table_plots:
+            table_plots.append(TablePlot())
+            session.on_ended(table_plots[0].close)
+        return table_plots[0]
+
+    @reactive.extended_task
+    async def solve_task(x, y, net_clearance, topspin, sidespin, refine, spread):
+        solve = refinements.start()
+        future, cancel = solve_in_pool(x, y, net_clearance, topspin, sidespin, refine, spread,
+                                       on_stage=lambda stage, trajectory: refinements.set(solve, stage, trajectory))
+        try:
+            trajectory, stats, report = await asyncio.wrap_future(future)
+            return (x, y), trajectory, stats, report
+        except asyncio.CancelledError:
+            cancel.set()  # stops the worker at its next objective evaluation
+            raise
+
+    # Re-renders the plot whenever the solver thread publishes a refinement
+    @reactive.poll(lambda: refinements.version, 0.05)
+    def refinement():
+        return refinements.latest()
+
+    @reactive.extended_task
+    async def reach_task(net_clearance, topspin, sidespin):
+        cancel = threading.Event()
+        future = reach_pool.submit(build_reach, net_clearance, topspin, sidespin, cancel)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            future.cancel()  # still queued behind another map
+            cancel.set()  # or stops the running build at its next Newton iteration
+            raise
+
+    # Nothing numerical is imported until the Target panel is opened for the first time
+    @reactive.effect
+    def open_target():
+        if input.main_tab() == "Target":
+            target_opened.set(True)
+
+    # Rebuild the reachability map when the settings change, cached maps come back immediately
+    @reactive.effect
+    def start_reach():
+        req(target_opened.get())
+        net_clearance = input.net_clearance() / 100
+        topspin = input.topspin()
+        sidespin = input.sidespin()
+        reach_task.cancel()
+        reach_task.invoke(net_clearance, topspin, sidespin)
+
+    def reach():
+        """Reachability map of the current settings, None while it is being built"""
+        return reach_task.result() if reach_task.status() == "success" else None
+
+    # Latest click wins: a new target cancels the running solve and any queued one
+    @reactive.effect
+    def start_solve():
         point = click_data.get()
-        fig, ax = plot_table()
+        net_clearance = input.net_clearance() / 100
+        topspin = input.topspin()
+        sidespin = input.sidespin()
+        refine = input.refine()
+        # the landing spread is flown where the solve runs, toggling it solves again (a cache hit once refined)
+        spread = input.spread()
 
+        solve_task.cancel()
+        solving_for.set(None)
+        out_of_reach.set(None)
+        with reactive.isolate():  # a finished map must not restart the solve
+            current_reach = reach()
         if point is not None:
             x, y = point
-            if x > TABLE_LENGTH / 2:
-                net_clearance = input.net_clearance() / 100
-                topspin = input.topspin()
-                sidespin = input.sidespin()
-                print(f"Solving for {x}, {y}m, clearance {net_clearance*100}cm, Tps{topspin}%, Sds{sidespin}%...")
-                t_vals, x_vals, y_vals, z_vals = calculate(x, y, net_clearance=net_clearance, topspin=topspin, sidespin=sidespin)
-                plot_trajectory(ax, x_vals, y_vals, z_vals)
+            if current_reach is not None and x > TABLE_LENGTH / 2 and not current_reach.reachable(x, y):
+                out_of_reach.set(point)
+            elif x > TABLE_LENGTH / 2:
+                logger.debug(f"Solving for {x}, {y}m, clearance {net_clearance*100}cm, "
+                             f"Tps{topspin}%, Sds{sidespin}%...")
+                solving_for.set(point)
+                solve_task.invoke(x, y, net_clearance, topspin, sidespin, refine, spread)
+
+    @reactive.calc
+    def scene():
+        """What the Target plot shows, drawn by plot() or by the browser"""
+        shown = dict(title="", target=None, rejected=False, trajectory=None, preview=False, spread=None)
+
+        status = solve_task.status() if solving_for.get() is not None else None
+        if out_of_reach.get() is not None:
+            shown.update(target=out_of_reach.get(), rejected=True, title="Out of reach with these settings")
+        elif status == "running":
+            shown.update(target=solving_for.get(), title="Solving...")
+            latest = refinement()
+            if latest is not None:
+                stage, trajectory = latest
+                shown.update(trajectory=trajectory, preview=True, title=f"Solving... ({stage})")
+        elif status == "success":
+            target, trajectory, stats, report = solve_task.result()
+            shown.update(target=target, trajectory=trajectory)
+            spread = report["spread"]
+            if spread is not None:
+                shown.update(spread=np.array(spread["ellipse"]),
+                             title=f"{spread['clears_net']:.0%} over the net, {spread['on_table']:.0%} in")
+            if shared_solver.cache is not None:
+                logger.debug(f"Solver cache {shared_solver.cache.stats()}")
+        elif status == "error":
+            shown.update(title=f"Solve failed: {solve_task.error.get()}")
+
+        return shown
+
+    @output
+    @render.plot
+    def plot():
+        fig, ax = table_plot().reset(reach())
+
+        shown = scene()
+        if shown["target"] is not None:
+            x, y = shown["target"]
+            ax[0].plot(x, y, "rx" if shown["rejected"] else "ro")
+        if shown["trajectory"] is not None:
+            t_vals, x_vals, y_vals, z_vals = shown["trajectory"]
+            plot_trajectory(ax, x_vals, y_vals, z_vals, preview=shown["preview"])
+        if shown["spread"] is not None:
+            ax[0].plot(shown["spread"][:, 0], shown["spread"][:, 1], color="purple", lw=2)
+        if shown["title"]:
+            ax[0].set_title(shown["title"])
 
         ax[0].set(
             xlim=[-0.1, TABLE_LENGTH+0.1],
@@ -92,6 +415,26 @@ def server_target(input, output, session):
 
         return fig
 
+    # Browser rendering: send only the data, target_svg.js draws it
+    @reactive.effect
+    async def send_scene():
+        if not input.browser_render():
+            return
+        shown = scene()
+        message = dict(title=shown["title"], target=shown["target"], rejected=shown["rejected"],
+                       preview=shown["preview"], trajectory=None, spread=None)
+        if shown["trajectory"] is not None:
+            message["trajectory"] = trajectory_message(*shown["trajectory"])
+        if shown["spread"] is not None:
+            message["spread"] = np.round(shown["spread"], 3).tolist()
+        await session.send_custom_message("target_scene", message)
+
+    @reactive.effect
+    async def send_reach():
+        if not input.browser_render():
+            return
+        await session.send_custom_message("target_reach", reach_message(reach()))
+
     @output
     @render.text
     def click_info():
@@ -100,3 +443,31 @@ def server_target(input, output, session):
             click_data.set((click["x"], click["y"]))
             return f"Clicked at: x={click['x']:.2f}, y={click['y']:.2f}"
         return "Click on the plot to see coordinates."
+
+    @output
+    @render.text
+    def solve_info():
+        if solving_for.get() is None or solve_task.status() != "success":
+            return ""
+        _, _, stats, _ = solve_task.result()
+        return f"Solved in {stats.summary()}"
+
+    @output
+    @render.text
+    def preset_info():
+        if solving_for.get() is None or solve_task.status() != "success":
+            return ""
+        target, _, _, report = solve_task.result()
+        return preset_text(target, report)
+
+    # The Control panel sends its sliders to the robot whenever they change
+    @reactive.effect
+    @reactive.event(input.use_preset)
+    def use_preset():
+        req(solving_for.get() is not None and solve_task.status() == "success")
+        _, _, _, report = solve_task.result()
+        if not report["within_limits"]:
+            ui.notification_show("These launch settings are outside the robot limits", type="warning", duration=2)
+            return
+        for name, value in report["preset"].items():
+            ui.update_slider(name, value=value)
@@ -0,0 +1,171 @@
+// Browser side renderer of the Target panel: draws the table, reachability, trajectory and markers as SVG
+// from the arrays sent by target_panel.py, and reports clicks as the same plot_click input as the plot.
+(function () {
+  const TABLE_LENGTH = 2.74;
+  const TABLE_WIDTH = 1.525;
+  const NET_HEIGHT = 0.1525;
+  const X_MIN = -0.1, X_MAX = TABLE_LENGTH + 0.1;
+  const Y_MAX = TABLE_WIDTH / 2 + 0.1;
+  const Z_MIN = -0.1, Z_MAX = 0.5;
+  const WIDTH = 400;
+  const SCALE = WIDTH / (X_MAX - X_MIN);  // px per m, same in both views
+  const TITLE = 24;
+  const TOP_HEIGHT = 2 * Y_MAX * SCALE;
+  const SIDE_TOP = TITLE + TOP_HEIGHT + 10;
+  const HEIGHT = SIDE_TOP + (Z_MAX - Z_MIN) * SCALE + 24;
+  const SVG = "http://www.w3.org/2000/svg";
+
+  const px = (x) => (x - X_MIN) * SCALE;
+  const topY = (y) => TITLE + (Y_MAX - y) * SCALE;
+  const sideY = (z) => SIDE_TOP + (Z_MAX - z) * SCALE;
+
+  let svg = null;
+  let layers = {};
+  let path = null;
+
+  function element(name, attributes, parent) {
+    const node = document.createElementNS(SVG, name);
+    for (const [key, value] of Object.entries(attributes)) node.setAttribute(key, value);
+    if (parent) parent.appendChild(node);
+    return node;
+  }
+
+  function line(parent, x1, y1, x2, y2, color, width) {
+    return element("line", {x1: x1, y1: y1, x2: x2, y2: y2, stroke: color, "stroke-width": width}, parent);
+  }
+
+  function polyline(parent, points, attributes) {
+    const coordinates = points.map(([a, b]) => `${a.toFixed(1)},${b.toFixed(1)}`).join(" ");
+    return element("polyline", Object.assign({points: coordinates, fill: "none"}, attributes), parent);
+  }
+
+  function setup(container) {
+    svg = element("svg", {width: WIDTH, height: HEIGHT, viewBox: `0 0 ${WIDTH} ${HEIGHT}`});
+    svg.style.cursor = "crosshair";
+    container.appendChild(svg);
+
+    const table = element("g", {}, svg);
+    element("rect", {x: px(0), y: topY(TABLE_WIDTH / 2), width: TABLE_LENGTH * SCALE, height: TABLE_WIDTH * SCALE,
+                     fill: "gray"}, table);
+    layers.reach = element("g", {}, svg);
+    const lines = element("g", {}, svg);
+    for (const x of [0, TABLE_LENGTH]) line(lines, px(x), topY(-TABLE_WIDTH / 2), px(x), topY(TABLE_WIDTH / 2), "blue", 3);
+    for (const y of [-TABLE_WIDTH / 2, TABLE_WIDTH / 2]) line(lines, px(0), topY(y), px(TABLE_LENGTH), topY(y), "blue", 3);
+    line(lines, px(0), topY(0), px(TABLE_LENGTH), topY(0), "blue", 1);
+    line(lines, px(TABLE_LENGTH / 2), topY(-TABLE_WIDTH / 2), px(TABLE_LENGTH / 2), topY(TABLE_WIDTH / 2), "red", 3);
+    line(lines, px(0), sideY(0), px(TABLE_LENGTH), sideY(0), "black", 8);
+    line(lines, px(TABLE_LENGTH / 2), sideY(0), px(TABLE_LENGTH / 2), sideY(NET_HEIGHT), "red", 3);
+
+    layers.scene = element("g", {}, svg);
+    layers.title = element("text", {x: WIDTH / 2, y: 17, "text-anchor": "middle", "font-size": 14}, svg);
+    layers.hover = element("g", {visibility: "hidden"}, svg);
+    element("circle", {r: 4, fill: "black"}, layers.hover).classList.add("top");
+    element("circle", {r: 4, fill: "black"}, layers.hover).classList.add("side");
+    layers.readout = element("text", {x: WIDTH / 2, y: HEIGHT - 6, "text-anchor": "middle", "font-size": 12}, svg);
+
+    svg.addEventListener("click", onClick);
+    svg.addEventListener("mousemove", onMove);
+    svg.addEventListener("mouseleave", () => {
+      layers.hover.setAttribute("visibility", "hidden");
+      layers.readout.textContent = "";
+    });
+  }
+
+  function mouse(event) {
+    const box = svg.getBoundingClientRect();
+    return [event.clientX - box.left, event.clientY - box.top];
+  }
+
+  function onClick(event) {
+    const [mx, my] = mouse(event);
+    if (my < TITLE || my > TITLE + TOP_HEIGHT) return;  // only the top view picks targets
+    const x = mx / SCALE + X_MIN;
+    const y = Y_MAX - (my - TITLE) / SCALE;
+    Shiny.setInputValue("plot_click", {x: x, y: y}, {priority: "event"});
+  }
+
+  function onMove(event) {
+    if (!path) return;
+    const [mx, my] = mouse(event);
+    const side = my > SIDE_TOP;
+    let best = -1, bestDistance = Infinity;
+    for (let i = 0; i < path.x.length; i++) {
+      const dx = px(path.x[i]) - mx;
+      const dy = (side ? sideY(path.z[i]) : topY(path.y[i])) - my;
+      const distance = dx * dx + dy * dy;
+      if (distance < bestDistance) { best = i; bestDistance = distance; }
+    }
+    if (bestDistance > 400) {  // more than 20 px away from the path
+      layers.hover.setAttribute("visibility", "hidden");
+      layers.readout.textContent = "";
+      return;
+    }
+    const [top, sideMarker] = layers.hover.children;
+    top.setAttribute("cx", px(path.x[best]));
+    top.setAttribute("cy", topY(path.y[best]));
+    sideMarker.setAttribute("cx", px(path.x[best]));
+    sideMarker.setAttribute("cy", sideY(path.z[best]));
+    layers.hover.setAttribute("visibility", "visible");
+    layers.readout.textContent = `t ${path.t[best].toFixed(2)} s, x ${path.x[best].toFixed(2)} m, ` +
+      `height ${path.z[best].toFixed(2)} m, speed ${path.speed[best].toFixed(1)} m/s`;
+  }
+
+  function speedColor(speed, maxSpeed) {
+    // light green for slow shots, dark green for fast ones, like the YlGn_r shading of the plot
+    const f = Math.min(speed / maxSpeed, 1);
+    return `rgb(${Math.round(255 - 220 * f)}, ${Math.round(255 - 120 * f)}, ${Math.round(200 - 160 * f)})`;
+  }
+
+  function drawReach(reach) {
+    layers.reach.replaceChildren();
+    if (!reach) return;
+    for (let i = 0; i < reach.speed.length; i++) {
+      for (let j = 0; j < reach.speed[i].length; j++) {
+        const speed = reach.speed[i][j];
+        if (speed === null) continue;
+        element("rect", {
+          x: px(reach.x_edges[i]), y: topY(reach.y_edges[j + 1]),
+          width: (reach.x_edges[i + 1] - reach.x_edges[i]) * SCALE + 0.5,
+          height: (reach.y_edges[j + 1] - reach.y_edges[j]) * SCALE + 0.5,
+          fill: speedColor(speed, reach.max_speed), "fill-opacity": 0.6,
+        }, layers.reach);
+      }
+    }
+  }
+
+  function drawScene(scene) {
+    layers.scene.replaceChildren();
+    layers.title.textContent = scene.title;
+    path = scene.trajectory;
+
+    if (path) {
+      const style = {stroke: "orange", "stroke-width": 4, "stroke-opacity": scene.preview ? 0.5 : 0.75};
+      if (scene.preview) style["stroke-dasharray"] = "8 5";
+      polyline(layers.scene, path.x.map((x, i) => [px(x), topY(path.y[i])]), style);
+      polyline(layers.scene, path.x.map((x, i) => [px(x), sideY(path.z[i])]), style);
+    }
+    if (scene.spread) {
+      polyline(layers.scene, scene.spread.map(([x, y]) => [px(x), topY(y)]), {stroke: "purple", "stroke-width": 2});
+    }
+    if (scene.target) {
+      const [x, y] = scene.target;
+      if (scene.rejected) {
+        line(layers.scene, px(x) - 4, topY(y) - 4, px(x) + 4, topY(y) + 4, "red", 2);
+        line(layers.scene, px(x) - 4, topY(y) + 4, px(x) + 4, topY(y) - 4, "red", 2);
+      } else {
+        element("circle", {cx: px(x), cy: topY(y), r: 4, fill: "red"}, layers.scene);
+      }
+    }
+  }
+
+  function container() {
+    const node = document.getElementById("target_svg");
+    if (node && !svg) setup(node);
+    return node;
+  }
+
+  document.addEventListener("DOMContentLoaded", () => {
+    Shiny.addCustomMessageHandler("target_scene", (scene) => { if (container()) drawScene(scene); });
+    Shiny.addCustomMessageHandler("target_reach", (reach) => { if (container()) drawReach(reach); });
+  });
+})();
@@ -1,11 +1,15 @@
+import logging
+import math
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 import numpy as np
-import matplotlib.pyplot as plt
 from scipy.integrate import solve_ivp
-from scipy.optimize import minimize, NonlinearConstraint, Bounds
+from scipy.optimize import minimize, least_squares, NonlinearConstraint, Bounds
 
+from solve_stats import SolveStats
 
-import matplotlib
-#matplotlib.use('TkAgg')
 
 # Constants
 g = 9.81  # Gravity (m/s^2)
@@ -38,6 +42,30 @@ omega_max = 0.10472 * max_rpm  # Max spin (rad/s)
 
 reg_factor = 0.01
 
+# Axes of the requested spin, as indices in (omega_x, omega_y, omega_z). The launcher spins the ball about y
+# for topspin (forward over the top) and about z for sidespin (curving it towards +y), it cannot spin it
+# about the x axis it flies along.
+TOPSPIN_AXIS = 1
+SIDESPIN_AXIS = 2
+
+logger = logging.getLogger(__name__)
+
+
+def physics_constants():
+    """Constants that precomputed trajectory data depends on"""
+    return dict(g=g, rho=rho, C_d=C_d, C_l=C_l, r=r, m=m,
+                ROBOT_HEAD_X=ROBOT_HEAD_X, ROBOT_HEAD_Y=ROBOT_HEAD_Y, ROBOT_HEAD_Z=ROBOT_HEAD_Z,
+                TOPSPIN_AXIS=TOPSPIN_AXIS, SIDESPIN_AXIS=SIDESPIN_AXIS)
+
+
+def spin_vector(topspin, sidespin):
+    """(..., 3) spin vectors (omega_x, omega_y, omega_z) for topspin and sidespin in % of omega_max"""
+    topspin, sidespin = np.broadcast_arrays(np.asarray(topspin, dtype=float), np.asarray(sidespin, dtype=float))
+    omega = np.zeros(topspin.shape + (3,))
+    omega[..., TOPSPIN_AXIS] = omega_max * topspin / 100
+    omega[..., SIDESPIN_AXIS] = omega_max * sidespin / 100
+    return omega
+
 # Magnus force function
 def magnus_force(v, omega):
     return 0.5 * C_l * rho * A * r * np.cross(omega, v)
@@ -61,7 +89,219 @@ def equations(t, y, omega):
     return [vx, vy, vz, ax, ay, az]
 
 
+# Accelerations per unit velocity: drag = -DRAG_COEFF * |v| * v, magnus = MAGNUS_COEFF * omega x v
+DRAG_COEFF = 0.5 * rho * C_d * A / m
+MAGNUS_COEFF = 0.5 * C_l * rho * A * r / m
+
+
+def equations_fast(t, y, omega):
+    """Same right hand side as `equations` in plain float arithmetic, about 40x faster per call.
+
+    y is the state as a numpy array and omega a tuple of floats, the constants are folded into DRAG_COEFF
+    and MAGNUS_COEFF. Returns a new list, as solve_ivp keeps references to earlier evaluations.
+    """
+    x, y, z, vx, vy, vz = y.tolist()
+    omega_x, omega_y, omega_z = omega
+
+    drag = -DRAG_COEFF * math.sqrt(vx * vx + vy * vy + vz * vz)
+    return [
+        vx, vy, vz,
+        drag * vx + MAGNUS_COEFF * (omega_y * vz - omega_z * vy),
+        drag * vy + MAGNUS_COEFF * (omega_z * vx - omega_x * vz),
+        drag * vz + MAGNUS_COEFF * (omega_x * vy - omega_y * vx) - g,
+    ]
+
+
+# Right hand sides _solve_flight can integrate with, "reference" is the original vector formulation
+RHS_KERNELS = {
+    "reference": equations,
+    "fast": equations_fast,
+}
+
+
+# Dormand-Prince 5(4) tableau, the same one solve_ivp uses for method='RK45'
+_DP_C = np.array([0, 1 / 5, 3 / 10, 4 / 5, 8 / 9, 1])
+_DP_A = [
+    np.array([]),
+    np.array([1 / 5]),
+    np.array([3 / 40, 9 / 40]),
+    np.array([44 / 45, -56 / 15, 32 / 9]),
+    np.array([19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729]),
+    np.array([9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656]),
+]
+_DP_B = np.array([35 / 384, 0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84])
+_DP_E = np.array([-71 / 57600, 0, 71 / 16695, -71 / 1920, 17253 / 339200, -22 / 525, 1 / 40])
+_DP_P = np.array([
+    [1, -8048581381 / 2820520608, 8663915743 / 2820520608, -12715105075 / 11282082432],
+    [0, 0, 0, 0],
+    [0, 131558114200 / 32700410799, -68118460800 / 10900136933, 87487479700 / 32700410799],
+    [0, -1754552775 / 470086768, 14199869525 / 1410260304, -10690763975 / 1880347072],
+    [0, 127303824393 / 49829197408, -318862633887 / 49829197408, 701980252875 / 199316789632],
+    [0, -282668133 / 205662961, 2019193451 / 616988883, -1453857185 / 822651844],
+    [0, 40617522 / 29380423, -110615467 / 29380423, 69997945 / 29380423],
+])
+
+
+def equations_batch(state, omega, out=None):
+    """Right hand side of `equations` for an (N, 6) state and (N, 3) omega, written into out if given"""
+    if out is None:
+        out = np.empty_like(state)
+    v = state[:, 3:]
+    vx, vy, vz = v.T
+    omega_x, omega_y, omega_z = omega.T
+
+    out[:, :3] = v
+    acc = out[:, 3:]
+    np.multiply(v, (-DRAG_COEFF * np.sqrt(np.einsum("ij,ij->i", v, v)))[:, None], out=acc)
+    acc[:, 0] += MAGNUS_COEFF * (omega_y * vz - omega_z * vy)
+    acc[:, 1] += MAGNUS_COEFF * (omega_z * vx - omega_x * vz)
+    acc[:, 2] += MAGNUS_COEFF * (omega_x * vy - omega_y * vx) - g
+
+    return out
+
+
+def _rms(values):
+    return np.sqrt(np.mean(values ** 2, axis=1))
+
+
+def _dense(theta, h, y0, q):
+    """RK45 dense output inside a step, theta in [0, 1]"""
+    powers = np.cumprod(np.repeat(theta[:, None], 4, axis=1), axis=1)
+    return y0 + h[:, None] * np.einsum("nik,nk->ni", q, powers)
+
+
+def _step_crossing(h, y0, k, component, level):
+    """Locate where `component` crosses `level` inside each step by bisection on the dense output"""
+    q = np.einsum("sni,sk->nik", k, _DP_P)
+    lo = np.zeros(len(h))
+    hi = np.ones(len(h))
+    rising = _dense(hi, h, y0, q)[:, component] > y0[:, component]
+    for _ in range(40):
+        mid = 0.5 * (lo + hi)
+        below = (_dense(mid, h, y0, q)[:, component] < level) == rising
+        lo = np.where(below, mid, lo)
+        hi = np.where(below, hi, mid)
+    return _dense(0.5 * (lo + hi), h, y0, q)
+
+
+def simulate_batch(v0, omega, t_max=5, rtol=1e-3, atol=1e-6, stats=None, path_times=None):
+    """Integrate N trajectories at once until each of them lands on the table plane.
+
+    v0 and omega are (N, 3) arrays of launch velocities and spin vectors. Every trajectory keeps its own
+    adaptive RK45 step (same tableau and error control as solve_ivp) and stops as soon as it crosses z=0.
+
+    Returns (x_landing, y_landing, z_net) arrays of shape (N,). z_net is the height of the ball when it
+    crosses the net plane, nan if it lands before reaching it. Landing coordinates are nan for balls that
+    are still flying at t_max. Work done is added to stats (a SolveStats) when given, one right hand side
+    evaluation per trajectory and stage.
+
+    With path_times, an increasing array of S times, the position at each of them is returned as well, as a
+    fourth (N, S, 3) array that is nan once the ball has landed.
+    """
+    v0 = np.atleast_2d(np.asarray(v0, dtype=float))
+    omega = np.broadcast_to(np.asarray(omega, dtype=float), v0.shape)
+    n = len(v0)
+
+    state = np.empty((n, 6))
+    state[:, :3] = (ROBOT_HEAD_X, ROBOT_HEAD_Y, ROBOT_HEAD_Z)
+    state[:, 3:] = v0
+    deriv = equations_batch(state, omega)
+    t = np.zeros(n)
+
+    x_landing = np.full(n, np.nan)
+    y_landing = np.full(n, np.nan)
+    z_net = np.full(n, np.nan)
+    if path_times is not None:
+        paths = np.full((n, len(path_times), 3), np.nan)
+
+    # initial step, vectorized version of scipy's select_initial_step
+    scale = atol + np.abs(state) * rtol
+    d0 = _rms(state / scale)
+    d1 = _rms(deriv / scale)
+    h0 = np.where((d0 < 1e-5) | (d1 < 1e-5), 1e-6, 0.01 * d0 / np.maximum(d1, 1e-300))
+    h0 = np.minimum(h0, t_max)
+    d2 = _rms((equations_batch(state + h0[:, None] * deriv, omega) - deriv) / scale) / h0
+    h1 = np.where(
+        np.maximum(d1, d2) <= 1e-15,
+        np.maximum(1e-6, h0 * 1e-3),
+        (0.01 / np.maximum(np.maximum(d1, d2), 1e-300)) ** (1 / 5),
+    )
+    h = np.minimum(100 * h0, h1)
+    rejected = np.zeros(n, dtype=bool)
+
+    active = np.arange(n)
+    k = np.empty((7, n, 6))
+    evaluations = 2 * n
+    while len(active):
+        evaluations += 6 * len(active)
+        y = state[active]
+        f = deriv[active]
+        w = omega[active]
+        step = np.minimum(h[active], t_max - t[active])
+
+        k[0, :len(active)] = f
+        for s in range(1, 6):
+            dy = np.tensordot(_DP_A[s], k[:s, :len(active)], axes=1)
+            equations_batch(y + step[:, None] * dy, w, out=k[s, :len(active)])
+        y_new = y + step[:, None] * np.tensordot(_DP_B, k[:6, :len(active)], axes=1)
+        f_new = equations_batch(y_new, w, out=k[6, :len(active)])
+
+        error = step[:, None] * np.tensordot(_DP_E, k[:, :len(active)], axes=1)
+        scale = atol + np.maximum(np.abs(y), np.abs(y_new)) * rtol
+        error_norm = _rms(error / scale)
+
+        accepted = error_norm < 1
+        with np.errstate(divide="ignore"):
+            growth = np.where(error_norm == 0, 10, 0.9 * error_norm ** -0.2)
+        factor = np.minimum(10, growth)
+        factor = np.where(rejected[active], np.minimum(1, factor), factor)
+        factor = np.where(accepted, factor, np.maximum(0.2, growth))
+        h[active] = step * factor
+        rejected[active] = ~accepted
+
+        crosses_net = accepted & (y[:, 0] < NET_X) & (y_new[:, 0] >= NET_X)
+        if crosses_net.any():
+            at_net = _step_crossing(step[crosses_net], y[crosses_net], k[:, :len(active)][:, crosses_net], 0, NET_X)
+            # a step can land and then cross the net plane below the table, that is not a net crossing
+            z_net[active[crosses_net]] = np.where(at_net[:, 2] >= 0, at_net[:, 2], np.nan)
+
+        lands = accepted & (y[:, 2] > 0) & (y_new[:, 2] <= 0)
+        if lands.any():
+            at_table = _step_crossing(step[lands], y[lands], k[:, :len(active)][:, lands], 2, 0)
+            x_landing[active[lands]] = at_table[:, 0]
+            y_landing[active[lands]] = at_table[:, 1]
+
+        if path_times is not None:
+            for sample, sample_time in enumerate(path_times):
+                inside = accepted & (t[active] < sample_time) & (t[active] + step >= sample_time)
+                if inside.any():
+                    q = np.einsum("sni,sk->nik", k[:, :len(active)][:, inside], _DP_P)
+                    theta = (sample_time - t[active][inside]) / step[inside]
+                    paths[active[inside], sample] = _dense(theta, step[inside], y[inside], q)[:, :3]
+
+        done = active[accepted]
+        state[done] = y_new[accepted]
+        deriv[done] = f_new[accepted]
+        t[done] += step[accepted]
+
+        active = active[~lands & (t[active] < t_max) & np.isfinite(h[active])]
+
+    if stats is not None:
+        stats.simulations += n
+        stats.rhs_evals += evaluations
+
+    if path_times is not None:
+        paths[paths[:, :, 2] < 0] = np.nan  # sampled in the landing step, after the landing
+        return x_landing, y_landing, z_net, paths
+    return x_landing, y_landing, z_net
+
+
 def plot_trajectory(x_vals, y_vals, z_vals, target=None, landing=None):
+    # pyplot is only needed here, importing it with the module would slow down the app and solver workers
+    import matplotlib
+    import matplotlib.pyplot as plt
+    #matplotlib.use('TkAgg')
+
 # Plot trajectory
     fig = plt.figure(figsize=(16, 5))
     ax1 = fig.add_subplot(131, projection='3d')
@@ -182,33 +422,271 @@ def solve_trajectory(initial_pos, initial_speed, omega, target=None):
 
 
 
-def simulate_trajectory(vx0, vy0, vz0, omega_x, omega_y, omega_z):
-    initial_conditions = [ROBOT_HEAD_X, ROBOT_HEAD_Y, ROBOT_HEAD_Z, vx0, vy0, vz0]
-    omega = np.array([omega_x, omega_y, omega_z])
+def hit_table(t, y, omega):
+    """Integration event, the ball reaches the table plane on its way down"""
+    return y[2]
+
+hit_table.terminal = True
+hit_table.direction = -1
 
-    time_span = (0, 5)
+
+def cross_net(t, y, omega):
+    """Integration event, the ball crosses the net plane"""
+    return y[0] - NET_X
+
+cross_net.direction = 1
+
+
+def _solve_flight(vx0, vy0, vz0, omega_x, omega_y, omega_z, t_eval=None, stats=None, kernel="fast"):
+    """Integrate until the ball lands, with exact landing and net crossing events.
+
+    kernel names the right hand side in RHS_KERNELS, both give the same trajectory to rounding.
+    """
+    initial_conditions = [ROBOT_HEAD_X, ROBOT_HEAD_Y, ROBOT_HEAD_Z, vx0, vy0, vz0]
+    if kernel == "fast":
+        omega = (float(omega_x), float(omega_y), float(omega_z))
+    else:
+        omega = np.array([omega_x, omega_y, omega_z])
+
+    sol = solve_ivp(RHS_KERNELS[kernel], (0, 5), initial_conditions, t_eval=t_eval, method='RK45', args=(omega,),
+                    events=(hit_table, cross_net))
+    if stats is not None:
+        stats.simulations += 1
+        stats.rhs_evals += sol.nfev
+    return sol
+
+
+# Integrators of simulate_trajectory(), simulate_landing() and the optimizer, by name. "accurate" is solve_ivp,
+# the reference the others are checked against with profile_errors(). "balanced" takes the same adaptive
+# Dormand-Prince steps and dense output without solve_ivp's overhead. "fast" takes fixed RK4 steps with
+# cubic Hermite interpolation in between. Both evaluate their interpolation only at the landing, the net
+# crossing and the requested trajectory samples.
+INTEGRATOR_PROFILES = {
+    "fast": dict(method="RK4", step=0.1),
+    "balanced": dict(method="RK45", rtol=1e-3, atol=1e-6),
+    "accurate": dict(method="solve_ivp"),
+}
+
+T_MAX = 5  # s, integration limit of a flight
+
+
+def _rk4_step(derivative, t, h, y, f):
+    """One RK4 step, returns (y_new, f_new, interpolation coefficients)"""
+    k2 = derivative(t + h / 2, y + h / 2 * f)
+    k3 = derivative(t + h / 2, y + h / 2 * k2)
+    k4 = derivative(t + h, y + h * k3)
+    y_new = y + h / 6 * (f + 2 * k2 + 2 * k3 + k4)
+    f_new = derivative(t + h, y_new)
+    # cubic Hermite polynomial through (y, f) and (y_new, f_new), in powers of theta = (t' - t) / h
+    hermite = np.column_stack([h * f, 3 * (y_new - y) - h * (2 * f + f_new), 2 * (y - y_new) + h * (f + f_new)])
+    return y_new, f_new, hermite
+
+
+def _dp45_step(derivative, t, h, y, f):
+    """One Dormand-Prince step, returns (y_new, f_new, interpolation coefficients, error estimate)"""
+    k = np.empty((7, len(y)))
+    k[0] = f
+    for s in range(1, 6):
+        k[s] = derivative(t + _DP_C[s] * h, y + h * (_DP_A[s] @ k[:s]))
+    y_new = y + h * (_DP_B @ k[:6])
+    k[6] = derivative(t + h, y_new)
+    return y_new, k[6], h * (k.T @ _DP_P), h * (_DP_E @ k)
+
+
+def _initial_step(derivative, y, f, rtol, atol):
+    """First step of the adaptive integrator, as scipy's select_initial_step"""
+    scale = atol + np.abs(y) * rtol
+    d0 = np.sqrt(np.mean((y / scale) ** 2))
+    d1 = np.sqrt(np.mean((f / scale) ** 2))
+    h0 = 1e-6 if d0 < 1e-5 or d1 < 1e-5 else 0.01 * d0 / d1
+    d2 = np.sqrt(np.mean(((derivative(h0, y + h0 * f) - f) / scale) ** 2)) / h0
+    h1 = max(1e-6, h0 * 1e-3) if max(d1, d2) <= 1e-15 else (0.01 / max(d1, d2)) ** (1 / 5)
+    return min(100 * h0, h1)
+
+
+def _interpolate(y, coefficients, theta):
+    """State inside a step from its interpolation polynomial, theta in [0, 1]"""
+    return y + coefficients @ theta ** np.arange(1, coefficients.shape[1] + 1)
+
+
+def _crossing(y, coefficients, component, level):
+    """theta where `component` of the step's interpolation crosses level, by bisection"""
+    start = float(y[component])
+    powers = coefficients[component].tolist()
+
+    def value(theta):
+        return start + sum(c * theta ** (j + 1) for j, c in enumerate(powers))
+
+    rising = value(1.0) > start
+    lo, hi = 0.0, 1.0
+    for _ in range(30):
+        theta = (lo + hi) / 2
+        if (value(theta) < level) == rising:
+            lo = theta
+        else:
+            hi = theta
+    return (lo + hi) / 2
+
+
+def _lean_flight(rhs, y0, omega, profile, t_eval=()):
+    """Integrate rhs(t, y, omega) from y0 with the "fast" or "balanced" profile until the ball lands.
+
+    Returns (samples, t_landing, landing, crossing, evaluations): the states at the t_eval times before the
+    landing as an array, the landing time and state, the state at the net plane and the number of rhs
+    evaluations. landing is None if the ball still flies at T_MAX, crossing if it lands before the net.
+    """
+    settings = INTEGRATOR_PROFILES[profile]
+    evaluations = 0
+
+    def derivative(t, y):
+        nonlocal evaluations
+        evaluations += 1
+        return np.asarray(rhs(t, y, omega), dtype=float)
+
+    t = 0.0
+    y = np.asarray(y0, dtype=float)
+    f = derivative(t, y)
+    if settings["method"] == "RK4":
+        h_next = settings["step"]
+    else:
+        rtol, atol = settings["rtol"], settings["atol"]
+        h_next = _initial_step(derivative, y, f, rtol, atol)
+    rejected = False
+
+    samples = []
+    landing = crossing = t_landing = None
+    while t < T_MAX and landing is None:
+        h = min(h_next, T_MAX - t)
+        if settings["method"] == "RK4":
+            y_new, f_new, coefficients = _rk4_step(derivative, t, h, y, f)
+        else:  # adaptive, with the step size control of solve_ivp
+            y_new, f_new, coefficients, error = _dp45_step(derivative, t, h, y, f)
+            error_norm = np.sqrt(np.mean((error / (atol + np.maximum(np.abs(y), np.abs(y_new)) * rtol)) ** 2))
+            if error_norm >= 1:
+                h_next = h * max(0.2, 0.9 * error_norm ** -0.2)
+                rejected = True
+                continue
+            factor = 10 if error_norm == 0 else min(10, 0.9 * error_norm ** -0.2)
+            h_next = h * (min(1, factor) if rejected else factor)
+            rejected = False
+
+        end = 1.0
+        if y[2] > 0 >= y_new[2]:
+            end = _crossing(y, coefficients, 2, 0.0)
+            t_landing = t + end * h
+            landing = _interpolate(y, coefficients, end)
+            landing[2] = 0.0
+        if crossing is None and y[0] < NET_X <= y_new[0]:
+            theta = _crossing(y, coefficients, 0, NET_X)
+            if theta <= end:
+                crossing = _interpolate(y, coefficients, theta)
+                crossing[0] = NET_X
+
+        while len(samples) < len(t_eval) and t_eval[len(samples)] <= t + end * h:
+            samples.append(_interpolate(y, coefficients, (t_eval[len(samples)] - t) / h))
+
+        t, y, f = t + h, y_new, f_new
+
+    return np.array(samples).reshape(-1, len(y)), t_landing, landing, crossing, evaluations
+
+
+def simulate_trajectory(vx0, vy0, vz0, omega_x, omega_y, omega_z, stats=None, kernel="fast", profile="accurate"):
+    """Trajectory sampled every 10ms until it lands, the last sample is the exact landing point.
+
+    profile names the integrator in INTEGRATOR_PROFILES. With "accurate", kernel selects the right hand side
+    solve_ivp integrates, "fast" (equations_fast) or "reference" (equations).
+    """
     time_eval = np.linspace(0, 5, 500)
 
-    sol = solve_ivp(equations, time_span, initial_conditions, t_eval=time_eval, method='RK45', args=(omega,))
+    if profile != "accurate":
+        samples, t_landing, landing, _, evaluations = _lean_flight(
+            equations_fast, [ROBOT_HEAD_X, ROBOT_HEAD_Y, ROBOT_HEAD_Z, vx0, vy0, vz0],
+            (float(omega_x), float(omega_y), float(omega_z)), profile, t_eval=time_eval)
+        if stats is not None:
+            stats.simulations += 1
+            stats.rhs_evals += evaluations
+        t_vals = time_eval[:len(samples)]
+        if landing is not None:
+            t_vals = np.append(t_vals, t_landing)
+            samples = np.vstack([samples, landing])
+        return t_vals, samples[:, 0], samples[:, 1], samples[:, 2]
+
+    sol = _solve_flight(vx0, vy0, vz0, omega_x, omega_y, omega_z, t_eval=time_eval, stats=stats, kernel=kernel)
 
     t_vals, x_vals, y_vals, z_vals = sol.t, sol.y[0], sol.y[1], sol.y[2]
 
+    if len(sol.t_events[0]):
+        t_vals = np.append(t_vals, sol.t_events[0][0])
+        x_vals = np.append(x_vals, sol.y_events[0][0][0])
+        y_vals = np.append(y_vals, sol.y_events[0][0][1])
+        z_vals = np.append(z_vals, 0.0)
+
     return t_vals, x_vals, y_vals, z_vals
 
+
+def simulate_landing(vx0, vy0, vz0, omega_x, omega_y, omega_z, stats=None, kernel="fast", profile="accurate"):
+    """Exact landing point and height over the net plane (nan if the ball lands before the net).
+
+    profile names the integrator in INTEGRATOR_PROFILES, the other profiles give a nan landing for balls still
+    flying at T_MAX where "accurate" extrapolates it.
+    """
+    if profile != "accurate":
+        _, _, landing, crossing, evaluations = _lean_flight(
+            equations_fast, [ROBOT_HEAD_X, ROBOT_HEAD_Y, ROBOT_HEAD_Z, vx0, vy0, vz0],
+            (float(omega_x), float(omega_y), float(omega_z)), profile)
+        if stats is not None:
+            stats.simulations += 1
+            stats.rhs_evals += evaluations
+        x_landing, y_landing = landing[:2] if landing is not None else (np.nan, np.nan)
+        z_net = crossing[2] if crossing is not None else np.nan
+        return x_landing, y_landing, z_net
+
+    sol = _solve_flight(vx0, vy0, vz0, omega_x, omega_y, omega_z, stats=stats, kernel=kernel)
+
+    if len(sol.t_events[0]):
+        x_landing, y_landing = sol.y_events[0][0][:2]
+    else:  # still flying after 5s
+        t_vals, x_vals, y_vals, z_vals = sol.t, sol.y[0], sol.y[1], sol.y[2]
+        x_landing, y_landing = find_landing(t_vals, x_vals, y_vals, z_vals)
+
+    z_net = sol.y_events[1][0][2] if len(sol.t_events[1]) else np.nan
+
+    return x_landing, y_landing, z_net
+
+
+def profile_errors(launches, reference="accurate"):
+    """Landing error of every integrator profile against the reference one, for launches of
+    (vx0, vy0, vz0, omega_x, omega_y, omega_z).
+
+    Returns {profile: dict(max_error, mean_error, wall_time)}: the largest and mean distance (m) between the
+    landing points of the profile and of the reference, and the mean time (s) of one simulate_landing().
+    """
+    expected = np.array([simulate_landing(*launch, profile=reference)[:2] for launch in launches])
+    errors = {}
+    for profile in INTEGRATOR_PROFILES:
+        start = time.perf_counter()
+        landings = np.array([simulate_landing(*launch, profile=profile)[:2] for launch in launches])
+        wall_time = (time.perf_counter() - start) / len(launches)
+        distance = np.hypot(*(landings - expected).T)
+        errors[profile] = dict(max_error=float(distance.max()), mean_error=float(distance.mean()),
+                               wall_time=wall_time)
+    return errors
+
+
 def find_landing(t_vals, x_vals, y_vals, z_vals):
 
-    for i in range(len(z_vals) - 1):
-        if z_vals[i] > 0 and z_vals[i + 1] <= 0:  # Ball crosses the table height
-            # Interpolate landing position
-            x1, x2 = x_vals[i], x_vals[i + 1]
-            y1, y2 = y_vals[i], y_vals[i + 1]
-            z1, z2 = z_vals[i], z_vals[i + 1]
-
-            # Linear interpolation to estimate exact (x, y) at z = 0
-            alpha = -z1 / (z2 - z1)
-            x_landing = x1 + alpha * (x2 - x1)
-            y_landing = y1 + alpha * (y2 - y1)
-            break
+    crossings = np.flatnonzero((z_vals[:-1] > 0) & (z_vals[1:] <= 0))  # Ball crosses the table height
+    if len(crossings):
+        i = crossings[0]
+        # Interpolate landing position
+        x1, x2 = x_vals[i], x_vals[i + 1]
+        y1, y2 = y_vals[i], y_vals[i + 1]
+        z1, z2 = z_vals[i], z_vals[i + 1]
+
+        # Linear interpolation to estimate exact (x, y) at z = 0
+        alpha = -z1 / (z2 - z1)
+        x_landing = x1 + alpha * (x2 - x1)
+        y_landing = y1 + alpha * (y2 - y1)
     else: # no landing, extrapolate a simple parabolic drop
         dt = t_vals[-1] - t_vals[-2]
         vx0 = (x_vals[-1] - x_vals[-2]) / dt
@@ -230,15 +708,98 @@ def find_landing(t_vals, x_vals, y_vals, z_vals):
 
 
 
-def simplified_error_function(params, target_x, target_y, net_clearance):
+def _skew(u):
+    """Matrix of the cross product, _skew(u) @ v == np.cross(u, v)"""
+    return np.array([
+        [0, -u[2], u[1]],
+        [u[2], 0, -u[0]],
+        [-u[1], u[0], 0],
+    ])
+
+
+def sensitivity_equations(t, y, omega):
+    """Equations of motion extended with the sensitivities of the state to (vx0, vy0, vz0, omega).
+
+    y holds the state followed by the 6x6 matrix d(state)/d(vx0, vy0, vz0, omega_x, omega_y, omega_z).
+    """
+    state = y[:6]
+    sensitivity = y[6:].reshape(6, 6)
+    v = state[3:]
+    v_mag = np.linalg.norm(v)
+
+    jacobian = np.zeros((6, 6))  # d(derivative)/d(state)
+    jacobian[:3, 3:] = np.eye(3)
+    forcing = np.zeros((6, 6))  # d(derivative)/d(params)
+    if v_mag != 0:
+        jacobian[3:, 3:] = (-0.5 * rho * C_d * A * (v_mag * np.eye(3) + np.outer(v, v) / v_mag)
+                            + 0.5 * C_l * rho * A * r * _skew(omega)) / m
+        forcing[3:, 3:] = -0.5 * C_l * rho * A * r * _skew(v) / m
+
+    derivative = equations_fast(t, state, omega)
+
+    return np.concatenate([derivative, (jacobian @ sensitivity + forcing).ravel()])
+
+
+def simulate_landing_sensitivity(vx0, vy0, vz0, omega_x, omega_y, omega_z, stats=None, profile="accurate"):
+    """simulate_landing, plus the 3x6 jacobian of (x_landing, y_landing, z_net) with respect to
+    (vx0, vy0, vz0, omega_x, omega_y, omega_z), from one integration of the forward sensitivities.
+
+    Event times move with the parameters: at landing dt/dp = -dz/dp / vz, at the net dt/dp = -dx/dp / vx.
+    profile names the integrator in INTEGRATOR_PROFILES.
+    """
+    initial_sensitivity = np.zeros((6, 6))
+    initial_sensitivity[3:, :3] = np.eye(3)
+    initial_conditions = np.concatenate([[ROBOT_HEAD_X, ROBOT_HEAD_Y, ROBOT_HEAD_Z, vx0, vy0, vz0],
+                                         initial_sensitivity.ravel()])
+    omega = np.array([omega_x, omega_y, omega_z])
+
+    if profile == "accurate":
+        sol = solve_ivp(sensitivity_equations, (0, 5), initial_conditions, method='RK45', args=(omega,),
+                        events=(hit_table, cross_net))
+        evaluations = sol.nfev
+        landing = sol.y_events[0][0] if len(sol.t_events[0]) else None
+        crossing = sol.y_events[1][0] if len(sol.t_events[1]) else None
+    else:
+        sol = None
+        _, _, landing, crossing, evaluations = _lean_flight(sensitivity_equations, initial_conditions, omega,
+                                                            profile)
+    if stats is not None:  # every evaluation of sensitivity_equations also evaluates equations
+        stats.simulations += 1
+        stats.rhs_evals += evaluations
+        stats.sensitivity_rhs_evals += evaluations
+
+    jacobian = np.zeros((3, 6))
+    if landing is not None:
+        sensitivity = landing[6:].reshape(6, 6)
+        dt = -sensitivity[2] / landing[5]
+        jacobian[0] = sensitivity[0] + landing[3] * dt
+        jacobian[1] = sensitivity[1] + landing[4] * dt
+        x_landing, y_landing = landing[:2]
+    elif sol is not None:  # still flying after 5s
+        t_vals, x_vals, y_vals, z_vals = sol.t, sol.y[0], sol.y[1], sol.y[2]
+        x_landing, y_landing = find_landing(t_vals, x_vals, y_vals, z_vals)
+    else:
+        x_landing, y_landing = np.nan, np.nan
+
+    if crossing is not None:
+        sensitivity = crossing[6:].reshape(6, 6)
+        dt = -sensitivity[0] / crossing[3]
+        jacobian[2] = sensitivity[2] + crossing[5] * dt
+        z_net = crossing[2]
+    else:
+        z_net = np.nan
+
+    return x_landing, y_landing, z_net, jacobian
+
+
+def simplified_error_function(params, target_x, target_y, net_clearance, stats=None, profile="accurate"):
     """Solve the problem with flatspin"""
     vx0, vy0, vz0, = params
-    t_vals, x_vals, y_vals, z_vals = simulate_trajectory(vx0, vy0, vz0, 0, 0, 0)
-    x_landing, y_landing = find_landing(t_vals, x_vals, y_vals, z_vals)
+    x_landing, y_landing, z_net = simulate_landing(vx0, vy0, vz0, 0, 0, 0, stats=stats, profile=profile)
     # Compute squared error
     trajectory_error = (x_landing - target_x) ** 2 + (y_landing - target_y) ** 2
-    znet_clearance = z_vals[np.argmin(np.abs(x_vals - TABLE_LENGTH / 2))] - NET_HEIGHT
-    if znet_clearance < 0:
+    znet_clearance = z_net - NET_HEIGHT
+    if not znet_clearance >= 0:  # clipped the net or landed before it
         net_penalty = 1000
     else:
         net_penalty = (znet_clearance - net_clearance) ** 2
@@ -246,21 +807,22 @@ def simplified_error_function(params, target_x, target_y, net_clearance):
     return trajectory_error + net_penalty
 
 
-def error_function(params, target_x, target_y, net_clearance, target_topspin, target_sidespin):
+def error_function(params, target_x, target_y, net_clearance, target_topspin, target_sidespin, stats=None,
+                   profile="accurate"):
     vx0, vy0, vz0, omega_x, omega_y, omega_z = params
-    t_vals, x_vals, y_vals, z_vals = simulate_trajectory(vx0, vy0, vz0, omega_x, omega_y, omega_z)
-    x_landing, y_landing = find_landing(t_vals, x_vals, y_vals, z_vals)
+    x_landing, y_landing, z_net = simulate_landing(vx0, vy0, vz0, omega_x, omega_y, omega_z, stats=stats,
+                                                   profile=profile)
 
     # Energy penalty for high speed
     speed_penalty = reg_factor * 0.5 * m * (vx0**2 + vy0**2 + vz0**2)
 
-    #Penalty for deviating from intended spin
+    #Penalty for deviating from intended spin, the launcher cannot spin the ball about x
 
-    spin_penalty = reg_factor * ((omega_y - target_topspin)**2 + (omega_x-target_sidespin)**2)
+    spin_penalty = reg_factor * ((omega_y - target_topspin)**2 + (omega_z-target_sidespin)**2 + omega_x**2)
 
     #penalty for balls too far from the intended net height
-    znet_clearance = z_vals[np.argmin(np.abs(x_vals - TABLE_LENGTH/2))] - NET_HEIGHT
-    if znet_clearance < 0:
+    znet_clearance = z_net - NET_HEIGHT
+    if not znet_clearance >= 0:  # clipped the net or landed before it
         net_penalty = 1000
     else:
         net_penalty = (znet_clearance - net_clearance) ** 2
@@ -272,6 +834,123 @@ def error_function(params, target_x, target_y, net_clearance, target_topspin, ta
 
     return trajectory_error + speed_penalty + spin_penalty + net_penalty
 
+def simplified_error_function_and_grad(params, target_x, target_y, net_clearance, stats=None, profile="accurate"):
+    """simplified_error_function and its exact gradient, for minimize(..., jac=True)"""
+    vx0, vy0, vz0, = params
+    x_landing, y_landing, z_net, jacobian = simulate_landing_sensitivity(vx0, vy0, vz0, 0, 0, 0, stats=stats,
+                                                                         profile=profile)
+
+    trajectory_error = (x_landing - target_x) ** 2 + (y_landing - target_y) ** 2
+    grad = 2 * (x_landing - target_x) * jacobian[0] + 2 * (y_landing - target_y) * jacobian[1]
+
+    znet_clearance = z_net - NET_HEIGHT
+    if not znet_clearance >= 0:  # clipped the net or landed before it
+        net_penalty = 1000
+    else:
+        net_penalty = (znet_clearance - net_clearance) ** 2
+        grad = grad + 2 * (znet_clearance - net_clearance) * jacobian[2]
+
+    return trajectory_error + net_penalty, grad[:3]
+
+
+def error_function_and_grad(params, target_x, target_y, net_clearance, target_topspin, target_sidespin,
+                             stats=None, profile="accurate"):
+    """error_function and its exact gradient, for minimize(..., jac=True)"""
+    vx0, vy0, vz0, omega_x, omega_y, omega_z = params
+    x_landing, y_landing, z_net, jacobian = simulate_landing_sensitivity(vx0, vy0, vz0, omega_x, omega_y, omega_z,
+                                                                         stats=stats, profile=profile)
+
+    speed_penalty = reg_factor * 0.5 * m * (vx0**2 + vy0**2 + vz0**2)
+    spin_penalty = reg_factor * ((omega_y - target_topspin)**2 + (omega_z-target_sidespin)**2 + omega_x**2)
+    trajectory_error = (x_landing - target_x) ** 2 + (y_landing - target_y) ** 2
+
+    grad = 2 * (x_landing - target_x) * jacobian[0] + 2 * (y_landing - target_y) * jacobian[1]
+    grad[:3] += reg_factor * m * np.array([vx0, vy0, vz0])
+    grad[3] += 2 * reg_factor * omega_x
+    grad[4] += 2 * reg_factor * (omega_y - target_topspin)
+    grad[5] += 2 * reg_factor * (omega_z - target_sidespin)
+
+    znet_clearance = z_net - NET_HEIGHT
+    if not znet_clearance >= 0:  # clipped the net or landed before it
+        net_penalty = 1000
+    else:
+        net_penalty = (znet_clearance - net_clearance) ** 2
+        grad += 2 * (znet_clearance - net_clearance) * jacobian[2]
+
+    return trajectory_error + speed_penalty + spin_penalty + net_penalty, grad
+
+
+# Finite difference steps of (vx0, vy0, vz0, omega_x, omega_y, omega_z) for error_function_and_batch_grad
+FD_STEPS = np.array([1e-4, 1e-4, 1e-4, 1e-2, 1e-2, 1e-2])
+
+
+def error_function_and_batch_grad(params, target_x, target_y, net_clearance, target_topspin, target_sidespin,
+                                  stats=None, profile="accurate"):
+    """error_function and its central finite difference gradient, for minimize(..., jac=True).
+
+    The launch and its 12 perturbations are integrated together as one simulate_batch() at a tight
+    tolerance, which is faster than forward differences one simulation at a time but slower than the
+    sensitivity equations of error_function_and_grad(). Useful to check those, or when the model changes
+    before its sensitivity equations do. profile is not used, the batch integrator has its own.
+    """
+    params = np.asarray(params, dtype=float)
+    probes = np.vstack([params, params + np.diag(FD_STEPS), params - np.diag(FD_STEPS)])
+    x_landing, y_landing, z_net = simulate_batch(probes[:, :3], probes[:, 3:], rtol=1e-7, atol=1e-9, stats=stats)
+
+    # the terms of error_function, for every probe
+    vx0, vy0, vz0, omega_x, omega_y, omega_z = probes.T
+    speed_penalty = reg_factor * 0.5 * m * (vx0**2 + vy0**2 + vz0**2)
+    spin_penalty = reg_factor * ((omega_y - target_topspin)**2 + (omega_z - target_sidespin)**2 + omega_x**2)
+    znet_clearance = z_net - NET_HEIGHT
+    with np.errstate(invalid="ignore"):  # nan when landing before the net
+        net_penalty = np.where(znet_clearance >= 0, (znet_clearance - net_clearance) ** 2, 1000)
+    trajectory_error = (x_landing - target_x) ** 2 + (y_landing - target_y) ** 2
+    values = trajectory_error + speed_penalty + spin_penalty + net_penalty
+
+    return values[0], (values[1:7] - values[7:]) / (2 * FD_STEPS)
+
+
+def landing_residuals(params, target_x, target_y, net_clearance, target_topspin, target_sidespin, stats=None,
+                      profile="accurate"):
+    """Residual vector of the targeting problem and its 9x6 jacobian, for least_squares().
+
+    The residuals are the landing miss in x and y, the deviation from the wanted net clearance and the
+    speed and spin regularization terms, so their sum of squares equals error_function() whenever the ball
+    clears the net. Instead of its 1000 penalty, the net residual goes on smoothly below the top of the net
+    and, for balls landing before the net, continues with the distance they land short of it.
+    """
+    vx0, vy0, vz0, omega_x, omega_y, omega_z = params
+    x_landing, y_landing, z_net, jacobian = simulate_landing_sensitivity(vx0, vy0, vz0, omega_x, omega_y, omega_z,
+                                                                         stats=stats, profile=profile)
+    speed_weight = np.sqrt(reg_factor * 0.5 * m)
+    spin_weight = np.sqrt(reg_factor)
+
+    if np.isfinite(z_net):
+        net_residual, net_gradient = z_net - NET_HEIGHT - net_clearance, jacobian[2]
+    else:  # landed before the net plane, equal to the above for a ball landing right at the net
+        net_residual, net_gradient = x_landing - NET_X - NET_HEIGHT - net_clearance, jacobian[0]
+
+    residuals = np.array([
+        x_landing - target_x,
+        y_landing - target_y,
+        net_residual,
+        speed_weight * vx0,
+        speed_weight * vy0,
+        speed_weight * vz0,
+        spin_weight * (omega_y - target_topspin),
+        spin_weight * (omega_z - target_sidespin),
+        spin_weight * omega_x,
+    ])
+    residual_jacobian = np.zeros((9, 6))
+    residual_jacobian[:2] = jacobian[:2]
+    residual_jacobian[2] = net_gradient
+    residual_jacobian[3:6, :3] = speed_weight * np.eye(3)
+    residual_jacobian[6, 4] = spin_weight
+    residual_jacobian[7, 5] = spin_weight
+    residual_jacobian[8, 3] = spin_weight
+    return residuals, residual_jacobian
+
+
 # Set bounds on velocity and spin
 bounds = Bounds(
     [-v_max, -v_max, -v_max, -omega_max, -omega_max, -omega_max],  # Min values
@@ -288,31 +967,407 @@ target_topspin = -200
 target_sidespin = 0
 
 
-def calculate(target_x, target_y, net_clearance, topspin, sidespin):
+VERIFY_TOLERANCE = 0.005  # m, accepted difference between the landings of a solution with a cheaper integrator
+                          # profile and with the accurate one
 
-    initial_nospin = tuple(minimize(simplified_error_function, (20, 0, 5), method="SLSQP", args=(target_x, target_y, net_clearance)).x)
 
-    print(f"Initial nospin {initial_nospin} m/s")
+class SolveCancelled(Exception):
+    """Raised inside solve() or calculate_many() when its cancel event is set"""
 
-    #solve_trajectory(initial_pos=(ROBOT_HEAD_X, ROBOT_HEAD_Y, ROBOT_HEAD_Z),
-    #                 initial_speed=initial_nospin,
-    #                 omega=(0,0,0),
-    #                 target=(target_x, target_y)
-    #                 )
 
-    initial_guess = initial_nospin + (0, 0, 0)
+def _cancellable(function, cancel):
+    """Objective that aborts the optimizer as soon as cancel (a threading.Event) is set"""
+    if cancel is None:
+        return function
 
-    result = minimize(error_function, initial_guess, method='SLSQP', bounds=bounds, args=(target_x, target_y, net_clearance, omega_max*topspin/100, omega_max*sidespin/100))
+    def wrapper(*args):
+        if cancel.is_set():
+            raise SolveCancelled()
+        return function(*args)
 
-    # Extract optimized values
-    optimized_vx0, optimized_vy0, optimized_vz0, optimized_omega_x, optimized_omega_y, optimized_omega_z = result.x
-    print(f"Optimized Initial Velocity: vx={optimized_vx0:.2f}, vy={optimized_vy0:.2f}, vz={optimized_vz0:.2f}")
-    print(f"Optimized Spin: omega_x={optimized_omega_x:.2f}, omega_y={optimized_omega_y:.2f}, omega_z={optimized_omega_z:.2f}")
+    return wrapper
 
-    return simulate_trajectory(optimized_vx0, optimized_vy0, optimized_vz0, optimized_omega_x, optimized_omega_y, optimized_omega_z)
 
-    #solve_trajectory(initial_pos=(ROBOT_HEAD_X, ROBOT_HEAD_Y, ROBOT_HEAD_Z),
-    #                 initial_speed=(optimized_vx0, optimized_vy0, optimized_vz0),
-    #                 omega=(optimized_omega_x, optimized_omega_y, optimized_omega_z),
-    #                 target=(target_x, target_y, target_z),
-    #                 )
\ No newline at end of file
+class _Residuals:
+    """landing_residuals() as the separate residual and jacobian functions least_squares() calls, with one
+    integration per point. Aborts with SolveCancelled when cancel is set."""
+
+    def __init__(self, args, cancel=None):
+        self.args = args
+        self.cancel = cancel
+        self._params = None
+        self._value = None
+
+    def _evaluate(self, params):
+        if self._params is None or not np.array_equal(params, self._params):
+            if self.cancel is not None and self.cancel.is_set():
+                raise SolveCancelled()
+            self._value = landing_residuals(params, *self.args)
+            self._params = np.array(params)
+        return self._value
+
+    def residuals(self, params):
+        return self._evaluate(params)[0]
+
+    def jacobian(self, params):
+        return self._evaluate(params)[1]
+
+
+def _optimize(optimizer, initial_guess, args, cancel=None, stats=None, profile="accurate"):
+    """Final optimization of the launch parameters from initial_guess, args as error_function() takes them.
+
+    optimizer is "SLSQP" on error_function_and_grad(), "SLSQP_fd" on error_function_and_batch_grad() or
+    "least_squares" (bounded trust region reflective) on landing_residuals(). Returns (params, success, message,
+    iterations).
+    """
+    if optimizer == "least_squares":
+        residuals = _Residuals(args + (stats, profile), cancel)
+        result = least_squares(residuals.residuals, np.clip(initial_guess, bounds.lb, bounds.ub),
+                               jac=residuals.jacobian, bounds=(bounds.lb, bounds.ub), method="trf", x_scale="jac")
+        iterations = result.njev
+    else:
+        objective = error_function_and_batch_grad if optimizer == "SLSQP_fd" else error_function_and_grad
+        result = minimize(_cancellable(objective, cancel), initial_guess, method='SLSQP', jac=True,
+                          bounds=bounds, args=args + (stats, profile))
+        iterations = result.nit
+    return tuple(float(value) for value in result.x), bool(result.success), result.message, int(iterations)
+
+
+def solver_name(optimizer="SLSQP", profile="accurate", multi_start=0):
+    """Name of the optimizer and integrator profile that solve() runs, solutions are cached under it"""
+    return f"{'SLSQP multi-start' if multi_start else optimizer}/{profile}"
+
+
+def _launch_newton(wanted, omega, iterations, rtol, eps, tolerance, stats=None, initial=None, cancel=None):
+    """Newton iterations on the launch velocities of N shots with fixed spin, all integrated as one batch.
+
+    wanted is (N, 3) of target x, y and height over the net plane, omega the (N, 3) spin vectors and
+    initial the (N, 3) starting launch velocities, a flat shot towards the target by default. Each
+    iteration integrates every unconverged shot together with its three finite difference probes, the last
+    one takes no step. Returns (v0, residual, converged) with shapes (N, 3), (N, 3) and (N,), the residual
+    of each returned launch is where it landed, NaN if before the net. Raises SolveCancelled before an
+    iteration once cancel (a threading.Event) is set.
+    """
+    n = len(wanted)
+    if initial is None:
+        v0 = np.column_stack([np.full(n, 8.0), 8.0 * wanted[:, 1] / wanted[:, 0], np.full(n, 1.5)])
+    else:
+        v0 = np.array(initial, dtype=float)
+    residual = np.full((n, 3), np.nan)
+    converged = np.zeros(n, dtype=bool)
+
+    for iteration in range(iterations):
+        if cancel is not None and cancel.is_set():
+            raise SolveCancelled()
+        active = np.flatnonzero(~converged)
+        if not len(active):
+            break
+        probes = np.repeat(v0[active, None], 4, axis=1)
+        probes[:, 1:] += eps * np.eye(3)
+        landed = np.column_stack(simulate_batch(probes.reshape(-1, 3), np.repeat(omega[active], 4, axis=0),
+                                                rtol=rtol, stats=stats)).reshape(-1, 4, 3)
+
+        short = ~np.isfinite(landed).all(axis=(1, 2))  # landed before the net
+        residual[active[short]] = np.nan
+        residual[active[~short]] = landed[~short, 0] - wanted[active[~short]]
+        converged[active[~short]] = np.abs(residual[active[~short]]).max(axis=1) < tolerance
+        if iteration == iterations - 1:
+            break  # no step after the last integration, the residuals describe the returned launches
+
+        v0[active[short], 2] += 1  # aim higher
+        active, landed = active[~short], landed[~short]
+        stepping = ~converged[active]
+        active, landed = active[stepping], landed[stepping]
+
+        jacobian = np.swapaxes(landed[:, 1:] - landed[:, :1], 1, 2) / eps
+        step = np.einsum("nij,nj->ni", np.linalg.pinv(jacobian), residual[active])
+        damping = np.minimum(1, 3 / np.maximum(np.linalg.norm(step, axis=1), 1e-12))
+        v0[active] = np.clip(v0[active] - step * damping[:, None], -v_max, v_max)
+
+    return v0, residual, converged
+
+
+def quick_launch(target_x, target_y, net_clearance, topspin, sidespin, iterations=8, rtol=1e-2, eps=0.05,
+                 stats=None):
+    """Rough launch parameters in a few tens of milliseconds, for previews.
+
+    Spin is fixed to the requested topspin/sidespin and Newton iterations on (vx0, vy0, vz0) hit the target
+    point and net clearance, with a low accuracy integration and the finite difference jacobian of each
+    iteration integrated as one batch.
+    """
+    omega = spin_vector(topspin, sidespin)
+    wanted = np.array([[target_x, target_y, net_clearance + NET_HEIGHT]])
+    v0, _, _ = _launch_newton(wanted, omega[None], iterations, rtol, eps, tolerance=0.005, stats=stats)
+
+    return tuple(float(value) for value in v0[0]) + tuple(float(value) for value in omega)
+
+
+def calculate_many(targets, iterations=20, rtol=1e-6, eps=0.01, tolerance=1e-3, stats=None, initial=None,
+                   cancel=None):
+    """Launch parameters for many targets at once, for drills.
+
+    targets is a sequence of (target_x, target_y, net_clearance, topspin, sidespin) like calculate() takes.
+    Spin is kept at the requested topspin/sidespin and the launch velocities of all targets are solved
+    together with Newton iterations that share their integration batches, see _launch_newton().
+
+    Returns (params, residuals, converged): (N, 6) launch parameters (vx0, vy0, vz0, omega_x, omega_y,
+    omega_z), (N, 3) misses in landing x, y and net clearance (m), and (N,) flags of the targets hit
+    within tolerance (m). initial optionally holds (N, 3) launch velocities to start from, e.g. the
+    solutions of nearby targets. Setting the cancel event from another thread stops the solve with
+    SolveCancelled between Newton iterations.
+    """
+    targets = np.atleast_2d(np.asarray(targets, dtype=float))
+    target_x, target_y, net_clearance, topspin, sidespin = targets.T
+    omega = spin_vector(topspin, sidespin)
+    wanted = np.column_stack([target_x, target_y, net_clearance + NET_HEIGHT])
+
+    v0, residual, converged = _launch_newton(wanted, omega, iterations, rtol, eps, tolerance, stats=stats,
+                                             initial=initial, cancel=cancel)
+    return np.column_stack([v0, omega]), residual, converged
+
+
+# (speed factor, elevation offset in degrees) of the launch velocity at each multi-start, the first is the
+# initial guess itself
+MULTI_START_OFFSETS = [(1, 0), (1, 6), (1, -6), (0.85, 4), (1.15, -4), (0.9, 12), (1.1, -10), (0.75, 8)]
+
+_multi_start_pool = None
+
+
+def multi_start_pool(workers=None):
+    """Process pool shared by multi-start solves, created on first use.
+
+    Workers are spawned rather than forked so that they can be started from the threads of a running app.
+    Each one imports this module when it starts, so the first multi-start solve is slower than the next ones.
+    """
+    global _multi_start_pool
+    if _multi_start_pool is None:
+        _multi_start_pool = ProcessPoolExecutor(max_workers=workers or len(MULTI_START_OFFSETS),
+                                                mp_context=multiprocessing.get_context("spawn"))
+    return _multi_start_pool
+
+
+def _start_guesses(initial_guess, starts):
+    """Initial guesses spread around initial_guess, with its spin and rotated and scaled launch velocities"""
+    v0 = np.asarray(initial_guess[:3], dtype=float)
+    speed = np.linalg.norm(v0)
+    elevation = np.arcsin(v0[2] / speed)
+    azimuth = np.arctan2(v0[1], v0[0])
+
+    guesses = []
+    for factor, offset in MULTI_START_OFFSETS[:starts]:
+        angle = elevation + np.radians(offset)
+        velocity = factor * speed * np.array([np.cos(angle) * np.cos(azimuth), np.cos(angle) * np.sin(azimuth),
+                                              np.sin(angle)])
+        guesses.append(tuple(np.clip(velocity, -v_max, v_max)) + tuple(initial_guess[3:]))
+    return guesses
+
+
+def _optimize_start(initial_guess, target_x, target_y, net_clearance, target_topspin, target_sidespin,
+                    profile="accurate"):
+    """One start of solve_multi_start(), runs in a worker process.
+
+    Returns (params, objective, success, message, iterations, landing miss in m, clears the net, SolveStats).
+    """
+    stats = SolveStats()
+    result = minimize(error_function_and_grad, initial_guess, method='SLSQP', jac=True, bounds=bounds,
+                      args=(target_x, target_y, net_clearance, target_topspin, target_sidespin, stats, profile))
+    params = tuple(float(value) for value in result.x)
+    x_landing, y_landing, z_net = simulate_landing(*params, stats=stats, profile=profile)
+    miss = float(np.hypot(x_landing - target_x, y_landing - target_y))
+    clears = bool(z_net - NET_HEIGHT >= 0)
+    return params, float(result.fun), bool(result.success), result.message, int(result.nit), miss, clears, stats
+
+
+def solve_multi_start(initial_guess, target_x, target_y, net_clearance, topspin, sidespin, starts=4,
+                      tolerance=0.005, executor=None, cancel=None, stats=None, profile="accurate"):
+    """Final optimization from several initial guesses around initial_guess, in parallel.
+
+    Every start runs on executor (a process pool, multi_start_pool() by default). The best solution that
+    clears the net is kept, and the solve returns as soon as one start lands within tolerance (m) of the
+    target, so with as many workers as starts the wall time is that of the fastest good start. Returns
+    (params, success, message, iterations) of the best start.
+    """
+    executor = executor if executor is not None else multi_start_pool()
+    args = (target_x, target_y, net_clearance, omega_max * topspin / 100, omega_max * sidespin / 100, profile)
+    futures = [executor.submit(_optimize_start, guess, *args) for guess in _start_guesses(initial_guess, starts)]
+
+    best = None
+    iterations = 0
+    try:
+        for future in as_completed(futures):
+            if cancel is not None and cancel.is_set():
+                raise SolveCancelled()
+            params, objective, success, message, nit, miss, clears, start_stats = future.result()
+            iterations += nit
+            if stats is not None:
+                stats.add_work(start_stats)
+            if best is None or (clears, -objective) > (best[2], -best[1]):
+                best = (params, objective, clears, success, message)
+            if clears and miss < tolerance:
+                break
+    finally:
+        for future in futures:
+            future.cancel()  # starts still queued, running ones finish in the background
+
+    params, objective, clears, success, message = best
+    return params, success, message, iterations
+
+
+def solve_staged(target_x, target_y, net_clearance, topspin, sidespin, table=None, refine=True, cache=None,
+                 warm_starts=None, cancel=None, stats=None, multi_start=0, executor=None, profile="accurate",
+                 optimizer="SLSQP"):
+    """Successive refinements of the launch parameters, yields (stage, params) tuples.
+
+    The first refinement comes within a few tens of milliseconds: a cached solution (which is also the
+    last one), a warm start, a table lookup or quick_launch(). The optimizer stages follow, the last
+    tuple holds the final solution. See solve() for the arguments.
+    """
+    if stats is None:
+        stats = SolveStats()
+
+    start = time.perf_counter()
+    solver = solver_name(optimizer, profile, multi_start)
+    if cache is not None:
+        cached = cache.get(target_x, target_y, net_clearance, topspin, sidespin, solver=solver)
+        if cached is not None:
+            stats.add_stage("cached", time.perf_counter() - start)
+            stats.params, stats.success, stats.message = cached, True, "cached solution"
+            logger.info(f"Solved ({target_x:.2f}, {target_y:.2f}) from cache: {stats.summary()}")
+            yield "cached", cached
+            return
+
+    neighbour = None
+    if warm_starts is not None:
+        neighbour = warm_starts.nearest(target_x, target_y, net_clearance, topspin, sidespin)
+
+    if neighbour is not None:
+        logger.debug(f"Warm start from {neighbour}")
+        if not refine:
+            # the neighbour's launch as it is, where it lands tells how close the target is
+            x_landing, y_landing, _ = simulate_landing(*neighbour, stats=stats, profile=profile)
+            stats.add_stage("warm start", time.perf_counter() - start)
+            miss = float(np.hypot(x_landing - target_x, y_landing - target_y))
+            stats.params, stats.success = neighbour, True
+            stats.message = f"warm start, not refined, lands {miss * 1000:.0f}mm from the target"
+            logger.info(f"Solved ({target_x:.2f}, {target_y:.2f}): {stats.summary()}")
+            yield "warm start", neighbour
+            return
+        stats.add_stage("warm start", time.perf_counter() - start)
+        yield "warm start", neighbour
+        initial_guess = neighbour
+    elif table is not None:
+        looked_up = table.query(target_x, target_y, net_clearance, topspin, sidespin, stats=stats)
+        stats.add_stage("table", time.perf_counter() - start)
+        logger.debug(f"Table lookup {looked_up}")
+        if not refine:
+            stats.params, stats.success, stats.message = looked_up, True, "table lookup, not refined"
+            logger.info(f"Solved ({target_x:.2f}, {target_y:.2f}): {stats.summary()}")
+            yield "table", looked_up
+            return
+        yield "table", looked_up
+        initial_guess = looked_up
+    else:
+        preview = quick_launch(target_x, target_y, net_clearance, topspin, sidespin, stats=stats)
+        stats.add_stage("preview", time.perf_counter() - start)
+        yield "preview", preview
+
+        if multi_start or optimizer == "least_squares":
+            # the starts spread around the preview, or the smooth least squares problem, need no pre-solve
+            initial_guess = preview
+        else:
+            start = time.perf_counter()
+            nospin = minimize(_cancellable(simplified_error_function_and_grad, cancel), (20, 0, 5), method="SLSQP",
+                              jac=True, args=(target_x, target_y, net_clearance, stats, profile))
+            stats.add_stage("no spin", time.perf_counter() - start, nospin.nit, bool(nospin.success), nospin.message)
+            logger.debug(f"Initial nospin {tuple(nospin.x)} m/s")
+
+            initial_guess = tuple(nospin.x) + (0, 0, 0)
+            yield "no spin", initial_guess
+
+    start = time.perf_counter()
+    args = (target_x, target_y, net_clearance, omega_max * topspin / 100, omega_max * sidespin / 100)
+    if multi_start:
+        params, success, message, iterations = solve_multi_start(
+            initial_guess, target_x, target_y, net_clearance, topspin, sidespin, starts=multi_start,
+            executor=executor, cancel=cancel, stats=stats, profile=profile)
+    else:
+        params, success, message, iterations = _optimize(optimizer, initial_guess, args, cancel, stats, profile)
+    stats.add_stage("optimized", time.perf_counter() - start, iterations, success, message)
+
+    if profile != "accurate":
+        # the optimizer ran on a cheaper integrator, check the launch with the accurate one
+        start = time.perf_counter()
+        x_profile, y_profile, z_profile = simulate_landing(*params, stats=stats, profile=profile)
+        x_landing, y_landing, z_net = simulate_landing(*params, stats=stats)
+        difference = float(np.hypot(x_landing - x_profile, y_landing - y_profile))
+        verified = bool(difference < VERIFY_TOLERANCE and (z_net >= NET_HEIGHT) == (z_profile >= NET_HEIGHT))
+        stats.add_stage("verified", time.perf_counter() - start, success=verified,
+                        message=f"accurate landing {difference * 1000:.1f}mm from the {profile} one")
+        if not verified:
+            start = time.perf_counter()
+            params, success, message, iterations = _optimize(optimizer, params, args, cancel, stats)
+            stats.add_stage("polished", time.perf_counter() - start, iterations, success, message)
+
+    stats.params, stats.success, stats.message = params, success, message
+    logger.info(f"Solved ({target_x:.2f}, {target_y:.2f}): {stats.summary()}")
+    logger.debug(f"Optimized launch {params}")
+
+    if cache is not None and success:
+        # a cached solution is served as final, keep only launches that clear the net
+        _, _, z_net = simulate_landing(*params, stats=stats)
+        if z_net >= NET_HEIGHT:
+            cache.put(target_x, target_y, net_clearance, topspin, sidespin, params, solver=solver)
+    if warm_starts is not None and success:
+        warm_starts.add(target_x, target_y, net_clearance, topspin, sidespin, params)
+
+    yield "optimized", params
+
+
+def solve(target_x, target_y, net_clearance, topspin, sidespin, table=None, refine=True, cache=None,
+          warm_starts=None, cancel=None, stats=None, multi_start=0, executor=None, profile="accurate",
+          optimizer="SLSQP"):
+    """Launch parameters (vx0, vy0, vz0, omega_x, omega_y, omega_z) that land the ball on the target.
+
+    With a LandingTable the launch parameters are looked up instead of pre-solving without spin, and the
+    optimizer only runs as a refinement step if refine is set. Optimized solutions that converged and clear
+    the net are memoized in cache (a SolverCache) when one is given, under the solver_name() of the
+    optimizer and profile. With WarmStarts, the optimizer starts from the closest recently
+    solved target when there is one and skips both the lookup and the no-spin pre-solve. Without refine
+    that neighbour's launch is returned as it is, like a table lookup.
+
+    Setting the cancel event from another thread stops the solve with SolveCancelled. Pass a SolveStats as
+    stats to get evaluation counts, iterations and timings of the solve.
+
+    With multi_start set to a number of starts, the final optimization runs that many initial guesses in
+    parallel on executor and keeps the best one, see solve_multi_start().
+
+    profile names the integrator the optimizer runs on (see INTEGRATOR_PROFILES). With a cheaper one than
+    "accurate", the solution is simulated again with "accurate" and optimized again with it if the landings
+    differ by more than VERIFY_TOLERANCE or only one of them clears the net.
+
+    optimizer is "SLSQP" on the scalar error_function(), after a no-spin pre-solve, or "least_squares" on
+    the smooth landing_residuals() straight from the preview. Multi-start solves always run SLSQP.
+    """
+    for stage, params in solve_staged(target_x, target_y, net_clearance, topspin, sidespin, table=table,
+                                      refine=refine, cache=cache, warm_starts=warm_starts, cancel=cancel,
+                                      stats=stats, multi_start=multi_start, executor=executor, profile=profile,
+                                      optimizer=optimizer):
+        pass
+    return params
+
+
+def calculate(target_x, target_y, net_clearance, topspin, sidespin, table=None, refine=True, cache=None,
+              warm_starts=None, cancel=None, stats=None, multi_start=0, executor=None, profile="accurate",
+              optimizer="SLSQP"):
+    """Solve the launch for the target (see solve()) and return its simulated trajectory, always integrated
+    with the "accurate" profile"""
+    params = solve(target_x, target_y, net_clearance, topspin, sidespin, table=table, refine=refine, cache=cache,
+                   warm_starts=warm_starts, cancel=cancel, stats=stats, multi_start=multi_start, executor=executor,
+                   profile=profile, optimizer=optimizer)
+    return simulate_trajectory(*params, stats=stats)
+
+
+def calculate_staged(target_x, target_y, net_clearance, topspin, sidespin, **kwargs):
+    """Simulated trajectory of every refinement of solve_staged(), yields (stage, trajectory) tuples"""
+    for stage, params in solve_staged(target_x, target_y, net_clearance, topspin, sidespin, **kwargs):
+        yield stage, simulate_trajectory(*params, stats=kwargs.get("stats"))